@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class FrameConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "frame"
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_started
+        from frame.registry import compile_registry, reload_registry
+        from frame.serializers import compile_serializers
+
+        compile_serializers()
+        compile_registry()
+        if settings.DEBUG:
+            # Pick up configuration changes without restarting the server
+            request_started.connect(
+                reload_registry, dispatch_uid="frame_reload_registry"
+            )
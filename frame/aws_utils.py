@@ -1,61 +1,709 @@
-import boto3
+import atexit
+import fnmatch
+import os
+import re
+import threading
+import time
+import zlib
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from frame import transports
+from frame.publisher import AsyncPublisher, EventCoalescer
 
-sns_client = boto3.client("sns", region_name=settings.AWS_REGION)
-sqs_client = boto3.client("sqs", region_name=settings.AWS_REGION)
+PUBLISHER_THREADS = getattr(settings, "FRAME_EVENT_PUBLISHER_THREADS", 4)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service):
+    """
+    Get the process-wide boto3 client for an AWS service, creating it on first use.
+
+    boto3 itself is only imported here, so processes that never talk to AWS,
+    such as most ``manage.py`` commands and the local transports, don't pay
+    for loading it.  The SNS client's connection pool is sized for the
+    asynchronous publisher threads that share it.
+
+    :param service: The AWS service name, ``"sns"`` or ``"sqs"``.
+    :type service: str
+    :return: The boto3 client.
+    :rtype: botocore.client.BaseClient
+    """
+    client = _clients.get(service)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(service)
+            if client is None:
+                import boto3
+                from botocore.config import Config
+
+                config = None
+                if service == "sns":
+                    config = Config(max_pool_connections=max(10, PUBLISHER_THREADS))
+                client = boto3.client(
+                    service, region_name=settings.AWS_REGION, config=config
+                )
+                _clients[service] = client
+    return client
+
+
+def __getattr__(name):
+    # Keep the former module-level clients available
+    if name in ("sns_client", "sqs_client"):
+        return get_client(name[:3])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class ResolutionCache:
+    """
+    Process-wide cache for resolved AWS identifiers such as topic ARNs.
+
+    Entries expire after ``ttl`` seconds so renamed or recreated resources
+    are eventually picked up, and can be dropped early with ``invalidate``.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a cached value.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The cached value, or None if it is missing or expired.
+        :rtype: str or None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        return value
+
+    def set(self, key, value):
+        """
+        Cache a value.
+
+        :param key: The cache key.
+        :type key: str
+        :param value: The value to cache.
+        :type value: str
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key=None):
+        """
+        Drop a cached value, or every value when no key is given.
+
+        :param key: The cache key.
+        :type key: str or None
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+RESOLUTION_CACHE_TTL = getattr(settings, "FRAME_RESOLUTION_CACHE_TTL", 3600)
+
+
+def get_shard_count(channel):
+    """
+    Get the number of shards of a channel from ``FRAME_CHANNEL_SHARDS``.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :return: The number of shards, 1 for channels that are not sharded.
+    :rtype: int
+    """
+    return getattr(settings, "FRAME_CHANNEL_SHARDS", {}).get(channel, 1)
+
+
+def get_shard_channel(channel, key):
+    """
+    Get the shard channel, ``{channel}_{n}``, that events for a key go to.
+
+    Shards are chosen by the CRC32 of the key, so every event for the same
+    model instance goes to the same shard.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :param key: The routing key, such as the instance's pk.
+    :type key: object
+    :return: The shard channel, or the channel itself if it is not sharded.
+    :rtype: str
+    """
+    shards = get_shard_count(channel)
+    if shards <= 1:
+        return channel
+    return f"{channel}_{zlib.crc32(str(key).encode()) % shards}"
+
+
+def get_shard_channels(channel, shards=None):
+    """
+    Get the shard channels of a channel.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :param shards: Only include the shards with these numbers.
+    :type shards: set or None
+    :return: The shard channels, or the channel itself if it is not sharded.
+    :rtype: list
+    """
+    count = get_shard_count(channel)
+    if count <= 1:
+        return [channel]
+    return [f"{channel}_{n}" for n in range(count) if shards is None or n in shards]
+
+
+def get_parent_channel(channel):
+    """
+    Get the channel a shard channel belongs to.
+
+    :param channel: The name of a channel or shard channel.
+    :type channel: str
+    :return: The sharded channel, or the channel itself.
+    :rtype: str
+    """
+    parent, _, shard = channel.rpartition("_")
+    if parent and shard.isdigit() and int(shard) < get_shard_count(parent):
+        return parent
+    return channel
+
+
+def is_fifo_channel(channel):
+    """
+    Check whether a channel, or the channel a shard belongs to, is listed in
+    ``FRAME_FIFO_CHANNELS``.
+
+    FIFO channels deliver the events of each message group, one per model
+    instance, in the order they were published.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :rtype: bool
+    """
+    fifo_channels = getattr(settings, "FRAME_FIFO_CHANNELS", ())
+    return channel in fifo_channels or get_parent_channel(channel) in fifo_channels
+
+
+def get_queue_name(channel):
+    """
+    Get the name of a channel's SQS queue.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :return: ``{channel}_queue``, with the ``.fifo`` suffix for FIFO channels.
+    :rtype: str
+    """
+    if is_fifo_channel(channel):
+        return f"{channel}_queue.fifo"
+    return f"{channel}_queue"
+
+
+def get_dead_letter_queue_name(channel):
+    """
+    Get the name of the dead-letter queue of a channel's SQS queue.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :return: ``{channel}_dlq``, with the ``.fifo`` suffix for FIFO channels.
+    :rtype: str
+    """
+    if is_fifo_channel(channel):
+        return f"{channel}_dlq.fifo"
+    return f"{channel}_dlq"
+
+
+topic_arns = ResolutionCache(RESOLUTION_CACHE_TTL)
+queue_urls = ResolutionCache(RESOLUTION_CACHE_TTL)
+queue_arns = ResolutionCache(RESOLUTION_CACHE_TTL)
+
+
+def invalidate_resolution_cache(channel=None):
+    """
+    Drop cached topic ARNs and queue URLs and ARNs.
+
+    :param channel: The channel to invalidate, or None to invalidate everything.
+    :type channel: str or None
+    """
+    if channel is None:
+        topic_arns.invalidate()
+        queue_urls.invalidate()
+        queue_arns.invalidate()
+        return
+    queue_name = get_queue_name(channel)
+    queue_url = queue_urls.get(queue_name)
+    topic_arns.invalidate(channel)
+    queue_urls.invalidate(queue_name)
+    if queue_url:
+        queue_arns.invalidate(queue_url)
 
 
 def get_or_create_topic(channel):
     """
     Get or create an SNS topic for the given channel.
 
+    The ARN is cached, so ``create_topic`` is only called once per channel
+    until the cache entry expires or is invalidated.  FIFO channels get a
+    ``{channel}.fifo`` topic with content-based deduplication.
+
     :param channel: The name of the channel (SNS topic).
     :type channel: str
     :return: The ARN of the SNS topic, or None if there was an error.
     :rtype: str or None
     """
+    topic_arn = topic_arns.get(channel)
+    if topic_arn:
+        return topic_arn
     try:
-        response = sns_client.create_topic(Name=channel)
-        return response["TopicArn"]
+        if is_fifo_channel(channel):
+            response = get_client("sns").create_topic(
+                Name=f"{channel}.fifo",
+                Attributes={"FifoTopic": "true", "ContentBasedDeduplication": "true"},
+            )
+        else:
+            response = get_client("sns").create_topic(Name=channel)
+        topic_arn = response["TopicArn"]
+        topic_arns.set(channel, topic_arn)
+        return topic_arn
     except Exception as e:
         print(f"Error creating/getting SNS topic {channel}: {e}")
         return None
 
 
-def publish_event(channel, message):
+def get_or_create_queue(queue_name):
+    """
+    Get or create an SQS queue.  Names ending in ``.fifo`` create FIFO queues.
+
+    :param queue_name: The name of the SQS queue.
+    :type queue_name: str
+    :return: The URL of the SQS queue.
+    :rtype: str
+    """
+    queue_url = queue_urls.get(queue_name)
+    if not queue_url:
+        attributes = {}
+        if queue_name.endswith(".fifo"):
+            attributes = {"FifoQueue": "true", "ContentBasedDeduplication": "true"}
+        queue_url = get_client("sqs").create_queue(
+            QueueName=queue_name, Attributes=attributes
+        )["QueueUrl"]
+        queue_urls.set(queue_name, queue_url)
+    return queue_url
+
+
+def get_queue_arn(queue_url):
+    """
+    Get the ARN of an SQS queue.
+
+    :param queue_url: The URL of the SQS queue.
+    :type queue_url: str
+    :return: The ARN of the SQS queue.
+    :rtype: str
+    """
+    queue_arn = queue_arns.get(queue_url)
+    if not queue_arn:
+        queue_arn = get_client("sqs").get_queue_attributes(
+            QueueUrl=queue_url, AttributeNames=["QueueArn"]
+        )["Attributes"]["QueueArn"]
+        queue_arns.set(queue_url, queue_arn)
+    return queue_arn
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+_coalescer = None
+
+
+def _reset_after_fork():
+    # Forked processes must not share connection pools or publisher threads
+    global _clients_lock, _publisher, _publisher_lock, _coalescer
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    _publisher = None
+    _publisher_lock = threading.Lock()
+    _coalescer = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_publisher():
+    """
+    Get the process-wide asynchronous publisher, starting it on first use.
+
+    The publisher is configured with ``FRAME_EVENT_QUEUE_SIZE``,
+    ``FRAME_EVENT_PUBLISHER_THREADS``, ``FRAME_EVENT_QUEUE_FULL_POLICY`` and
+    ``FRAME_EVENT_SPILL_PATH``, and is flushed by ``flush_events`` when the
+    process exits.
+
+    :return: The asynchronous publisher.
+    :rtype: AsyncPublisher
+    """
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                full_policy = getattr(
+                    settings, "FRAME_EVENT_QUEUE_FULL_POLICY", "block"
+                )
+                spill_path = getattr(settings, "FRAME_EVENT_SPILL_PATH", None)
+                if full_policy == "spill" and not spill_path:
+                    # A shared default would mix the events of every project
+                    # on the host
+                    raise ImproperlyConfigured(
+                        "FRAME_EVENT_QUEUE_FULL_POLICY 'spill' requires "
+                        "FRAME_EVENT_SPILL_PATH"
+                    )
+                publisher = AsyncPublisher(
+                    _publish_now,
+                    max_size=getattr(settings, "FRAME_EVENT_QUEUE_SIZE", 10000),
+                    threads=PUBLISHER_THREADS,
+                    full_policy=full_policy,
+                    spill_path=spill_path,
+                )
+                publisher.start()
+                _publisher = publisher
+    return _publisher
+
+
+def get_coalescer():
+    """
+    Get the process-wide coalescer for rapid successive update events.
+
+    :return: The event coalescer.
+    :rtype: EventCoalescer
+    """
+    global _coalescer
+    if _coalescer is None:
+        with _publisher_lock:
+            if _coalescer is None:
+                _coalescer = EventCoalescer(publish_event)
+    return _coalescer
+
+
+def flush_events(timeout=None):
+    """
+    Wait for events held by the coalescer or queued by the asynchronous
+    publisher to be published.
+
+    :param timeout: The maximum number of seconds to wait. Defaults to
+        ``FRAME_EVENT_FLUSH_TIMEOUT``.
+    :type timeout: float or None
+    :return: True if every queued event was published.
+    :rtype: bool
     """
-    Publish an event message to the SNS topic for the given channel.
+    if _coalescer is not None:
+        _coalescer.flush()
+    if _publisher is None:
+        return True
+    if timeout is None:
+        timeout = getattr(settings, "FRAME_EVENT_FLUSH_TIMEOUT", 10)
+    return _publisher.flush(timeout)
+
+
+atexit.register(flush_events)
+
+
+def publish_event(channel, message, group_id=None):
+    """
+    Publish an event message to the given channel through the event transport.
+
+    With ``FRAME_EVENT_PUBLISH_MODE = "async"`` the message is queued and
+    published by a background thread instead.  Events on FIFO channels are
+    always published synchronously, since the publisher threads could
+    reorder them.
 
     :param channel: The name of the channel (SNS topic).
     :type channel: str
     :param message: The message to publish.
     :type message: str
+    :param group_id: The message group of the event on FIFO channels, such
+        as ``"{channel}:{pk}"``.
+    :type group_id: str or None
     """
+    if getattr(
+        settings, "FRAME_EVENT_PUBLISH_MODE", "sync"
+    ) == "async" and not is_fifo_channel(channel):
+        get_publisher().submit(channel, message)
+    else:
+        _publish_now(channel, message, group_id)
+
+
+def _publish_now(channel, message, group_id=None):
     try:
-        topic_arn = get_or_create_topic(channel)
-        if topic_arn:
-            sns_client.publish(TopicArn=topic_arn, Message=message)
+        transports.get_transport().publish(channel, message, group_id=group_id)
     except Exception as e:
         print(f"Error publishing event to {channel}: {e}")
 
 
+def publish_events(channel, messages, group_ids=None):
+    """
+    Publish several event messages to the given channel through the event transport.
+
+    The SNS transport sends them with ``publish_batch`` in chunks of ten, the
+    most SNS accepts per call.
+
+    :param channel: The name of the channel (SNS topic).
+    :type channel: str
+    :param messages: The messages to publish.
+    :type messages: list
+    :param group_ids: The message group of each message on FIFO channels.
+    :type group_ids: list or None
+    :return: The indexes of the messages that could not be published.
+    :rtype: list
+    """
+    return transports.get_transport().publish_batch(
+        channel, messages, group_ids=group_ids
+    )
+
+
+class Listener:
+    """
+    A listener function registered with ``@listener`` and its dispatch options.
+
+    Calling it calls the wrapped function.
+    """
+
+    def __init__(
+        self,
+        func,
+        max_concurrency=None,
+        timeout=None,
+        executor="thread",
+        batch_size=None,
+        max_wait=1.0,
+        max_attempts=None,
+        retry_backoff=None,
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown listener executor: {executor}")
+        self.func = func
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.executor = executor
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+    def get_max_attempts(self):
+        """
+        Get the number of deliveries after which a failing message is moved to
+        the dead-letter queue.  Defaults to ``FRAME_LISTENER_MAX_ATTEMPTS``.
+
+        :rtype: int
+        """
+        return self.max_attempts or getattr(settings, "FRAME_LISTENER_MAX_ATTEMPTS", 3)
+
+    def get_retry_delay(self, attempt):
+        """
+        Get the seconds to wait before retrying a message after a failed
+        attempt.  The delay doubles with every attempt, starting from
+        ``retry_backoff`` or ``FRAME_LISTENER_RETRY_BACKOFF``, up to
+        ``FRAME_LISTENER_MAX_BACKOFF``.
+
+        :param attempt: The number of the failed attempt, starting at 1.
+        :type attempt: int
+        :rtype: int
+        """
+        backoff = self.retry_backoff
+        if backoff is None:
+            backoff = getattr(settings, "FRAME_LISTENER_RETRY_BACKOFF", 5)
+        return int(
+            min(
+                backoff * 2 ** (attempt - 1),
+                getattr(settings, "FRAME_LISTENER_MAX_BACKOFF", 900),
+            )
+        )
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    @property
+    def name(self):
+        """
+        The dotted path of the listener function, used to record which
+        listeners have processed a message.
+        """
+        return f"{self.func.__module__}.{self.func.__qualname__}"
+
+    def __repr__(self):
+        return f"<Listener {self.name}>"
+
+
 listeners = {}
 
 
-def listener(channel):
+def is_channel_pattern(channel):
+    """
+    Check whether a listener channel is a glob pattern such as ``"Order*"``.
+
+    :param channel: The listener channel.
+    :type channel: str
+    :return: True if the channel is a pattern.
+    :rtype: bool
+    """
+    return channel != "*" and any(char in channel for char in "*?[")
+
+
+class DispatchTable:
+    """
+    An immutable mapping of channels to the listeners that receive them.
+
+    A channel's listeners are those registered for it exactly, then those of
+    every matching glob pattern, then the ``"*"`` listeners.  The patterns
+    are only matched the first time a channel is looked up; after that the
+    lookup is a single dict access.
+    """
+
+    def __init__(self, registry):
+        self.exact = {
+            channel: tuple(registered)
+            for channel, registered in registry.items()
+            if channel != "*" and not is_channel_pattern(channel)
+        }
+        self.patterns = tuple(
+            (re.compile(fnmatch.translate(channel)), tuple(registered))
+            for channel, registered in registry.items()
+            if is_channel_pattern(channel)
+        )
+        self.wildcard = tuple(registry.get("*", ()))
+        self._resolved = {}
+
+    def get(self, channel):
+        """
+        Get every listener that receives events from a channel.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :return: The listeners, in dispatch order.
+        :rtype: tuple
+        """
+        resolved = self._resolved.get(channel)
+        if resolved is None:
+            resolved = self.exact.get(channel, ())
+            for pattern, registered in self.patterns:
+                if pattern.match(channel):
+                    resolved += registered
+            resolved += self.wildcard
+            self._resolved[channel] = resolved
+        return resolved
+
+    def matches(self, channel):
+        """
+        Check whether a channel is matched by an exact or pattern listener.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :rtype: bool
+        """
+        return channel in self.exact or any(
+            pattern.match(channel) for pattern, _ in self.patterns
+        )
+
+
+_dispatch_table = None
+
+
+def compile_dispatch_table():
+    """
+    Compile the registered listeners into the dispatch table.
+
+    The worker calls this once its listener modules have been imported.
+    Registering another listener afterwards recompiles the table on the next
+    lookup.
+
+    :return: The dispatch table.
+    :rtype: DispatchTable
+    """
+    global _dispatch_table
+    _dispatch_table = DispatchTable(listeners)
+    return _dispatch_table
+
+
+def get_dispatch_table():
+    """
+    Get the compiled dispatch table, compiling it if necessary.
+
+    :return: The dispatch table.
+    :rtype: DispatchTable
+    """
+    return _dispatch_table or compile_dispatch_table()
+
+
+def listener(
+    channel,
+    max_concurrency=None,
+    timeout=None,
+    executor="thread",
+    batch_size=None,
+    max_wait=1.0,
+    max_attempts=None,
+    retry_backoff=None,
+):
     """
     Decorator to register a listener function for a given channel.
 
-    :param channel: The name of the channel to listen to.
+    The channel may be a glob pattern such as ``"Order*"``, or ``"*"`` to
+    receive every event.
+
+    Batch listeners, registered with ``batch_size``, are called with a list of
+    ``(channel, action, data)`` tuples instead of a single event.
+
+    :param channel: The name of the channel to listen to, or a glob pattern.
     :type channel: str
+    :param max_concurrency: The maximum number of concurrent calls, or None
+        for no limit.
+    :type max_concurrency: int or None
+    :param timeout: Seconds the worker waits for a call before giving up on
+        the message, which is then redelivered.
+    :type timeout: float or None
+    :param executor: Run the listener on a ``"thread"`` or, for CPU-heavy
+        work, a ``"process"``. Process listeners must be module-level functions.
+    :type executor: str
+    :param batch_size: Call the listener with up to this many events at once.
+    :type batch_size: int or None
+    :param max_wait: Seconds a batch listener waits for a batch to fill up.
+    :type max_wait: float
+    :param max_attempts: Deliveries of a message the listener fails on before
+        it is moved to the dead-letter queue.
+    :type max_attempts: int or None
+    :param retry_backoff: Seconds before the first retry of a failed message;
+        later retries wait twice as long as the previous one.
+    :type retry_backoff: float or None
     :return: The decorator function.
     :rtype: function
     """
 
     def decorator(func):
+        global _dispatch_table
         if channel not in listeners:
             listeners[channel] = []
-        listeners[channel].append(func)
+        listeners[channel].append(
+            Listener(
+                func,
+                max_concurrency,
+                timeout=timeout,
+                executor=executor,
+                batch_size=batch_size,
+                max_wait=max_wait,
+                max_attempts=max_attempts,
+                retry_backoff=retry_backoff,
+            )
+        )
+        _dispatch_table = None
         return func
 
     return decorator
@@ -63,14 +711,15 @@ def listener(channel):
 
 def get_listeners(channel):
     """
-    Get the list of listener functions registered for the given channel.
+    Get the listeners that receive events from the given channel, including
+    pattern and ``"*"`` listeners.
 
     :param channel: The name of the channel.
     :type channel: str
-    :return: List of listener functions.
-    :rtype: list
+    :return: The listeners, in dispatch order.
+    :rtype: tuple
     """
-    return listeners.get(channel, [])
+    return get_dispatch_table().get(channel)
 
 
 def get_channels():
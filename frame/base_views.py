@@ -67,9 +67,8 @@ class BaseCreateView(LoginRequiredMixin, NavigationMixin, FormsetMixin, CreateVi
             self.model._meta.app_label,
             self.model.__name__,
             self.request.user,
+            include_pk=False,
         )
-        if "pk" in context["enabled_fields"]:
-            context["enabled_fields"].remove("pk")
         context["return_url"] = self.model.__name__.lower() + "-list"
         context["model_class"] = self.model
         context["verbose_name"] = self.model._meta.verbose_name
@@ -111,9 +110,8 @@ class BaseUpdateView(LoginRequiredMixin, NavigationMixin, FormsetMixin, UpdateVi
             self.model._meta.app_label,
             self.model.__name__,
             self.request.user,
+            include_pk=False,
         )
-        if "pk" in context["enabled_fields"]:
-            context["enabled_fields"].remove("pk")
         context["return_url"] = self.model.__name__.lower() + "-list"
         context["model_class"] = self.model
         context["verbose_name"] = self.model._meta.verbose_name
@@ -226,9 +224,8 @@ class BaseListView(LoginRequiredMixin, ReportMixin, NavigationMixin, ListView):
             self.model.__name__,
             self.request.user,
             view_type="list",
+            include_pk=False,
         )
-        if "pk" in context["enabled_fields"]:
-            context["enabled_fields"].remove("pk")
         context["search_query"] = self.request.GET.get("search", "")
         context["app_label"] = self.model._meta.app_label
         context["model_class"] = self.model
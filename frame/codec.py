@@ -0,0 +1,232 @@
+"""
+Encoding of event messages.
+
+Events are encoded as plain JSON by default.  ``FRAME_EVENT_CODEC`` selects
+``"orjson"`` or ``"msgpack"`` instead, and payloads larger than
+``FRAME_EVENT_COMPRESS_THRESHOLD`` bytes are compressed with zlib.  Binary
+payloads are base64 encoded behind a ``frame1;`` prefix so they still fit in
+a text message.
+
+With ``FRAME_EVENT_BLOB_STORE`` set, messages larger than
+``FRAME_EVENT_OFFLOAD_THRESHOLD`` bytes are written to a blob store, S3 or
+the local filesystem, and only a pointer is published.
+``decode_event`` reverses all of this transparently.
+"""
+
+import base64
+import json
+import os
+import threading
+import uuid
+import zlib
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from frame import aws_utils
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PREFIX = "frame1;"
+
+# SNS and SQS accept messages up to 256 KiB
+DEFAULT_OFFLOAD_THRESHOLD = 200 * 1024
+
+
+class S3BlobStore:
+    """
+    Store offloaded event payloads in an S3 bucket.
+
+    Objects are not deleted once consumed, since every subscribed queue reads
+    them; expire them with a bucket lifecycle rule.
+    """
+
+    def __init__(self, bucket, prefix="frame-events/"):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, payload):
+        """
+        Store a payload.
+
+        :param payload: The payload.
+        :type payload: bytes
+        :return: The key of the stored payload.
+        :rtype: str
+        """
+        key = f"{self.prefix}{uuid.uuid4().hex}"
+        aws_utils.get_client("s3").put_object(Bucket=self.bucket, Key=key, Body=payload)
+        return key
+
+    def get(self, key):
+        """
+        Load a payload.
+
+        :param key: The key of the stored payload.
+        :type key: str
+        :return: The payload.
+        :rtype: bytes
+        """
+        response = aws_utils.get_client("s3").get_object(Bucket=self.bucket, Key=key)
+        return response["Body"].read()
+
+
+class FileBlobStore:
+    """
+    Store offloaded event payloads in a local directory.
+
+    A stand-in for S3 on single-node deployments and in tests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def put(self, payload):
+        os.makedirs(self.path, exist_ok=True)
+        key = uuid.uuid4().hex
+        with open(os.path.join(self.path, key), "wb") as blob:
+            blob.write(payload)
+        return key
+
+    def get(self, key):
+        with open(os.path.join(self.path, os.path.basename(key)), "rb") as blob:
+            return blob.read()
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """
+    Get the blob store for offloaded payloads.
+
+    ``FRAME_EVENT_BLOB_STORE`` is ``"s3"``, using the bucket in
+    ``FRAME_EVENT_BLOB_BUCKET``, or ``"file"``, using the directory in
+    ``FRAME_EVENT_BLOB_PATH``, which must be shared by every host.
+
+    :return: The blob store.
+    :rtype: S3BlobStore or FileBlobStore
+    :raises ImproperlyConfigured: If no blob store is configured.
+    """
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                store = getattr(settings, "FRAME_EVENT_BLOB_STORE", None)
+                if store is None:
+                    raise ImproperlyConfigured(
+                        "Offloaded events require FRAME_EVENT_BLOB_STORE"
+                    )
+                if store == "s3":
+                    _blob_store = S3BlobStore(settings.FRAME_EVENT_BLOB_BUCKET)
+                elif store == "file":
+                    _blob_store = FileBlobStore(
+                        getattr(settings, "FRAME_EVENT_BLOB_PATH", "frame_event_blobs")
+                    )
+                else:
+                    raise ImproperlyConfigured(
+                        f"Unknown FRAME_EVENT_BLOB_STORE {store!r}"
+                    )
+    return _blob_store
+
+
+def _dumps(event, codec):
+    if codec == "json":
+        return json.dumps(event).encode()
+    if codec == "orjson":
+        if orjson is None:
+            raise ImproperlyConfigured("FRAME_EVENT_CODEC 'orjson' requires orjson")
+        return orjson.dumps(event)
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ImproperlyConfigured("FRAME_EVENT_CODEC 'msgpack' requires msgpack")
+        return msgpack.packb(event)
+    raise ImproperlyConfigured(f"Unknown FRAME_EVENT_CODEC {codec!r}")
+
+
+def _loads(payload, codec):
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ValueError("Received a msgpack event but msgpack is not installed")
+        return msgpack.unpackb(payload)
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def encode_event(event):
+    """
+    Encode an event for publishing.
+
+    :param event: The event, with ``channel``, ``action`` and ``data`` keys.
+    :type event: dict
+    :return: The encoded message.
+    :rtype: str
+    """
+    codec = getattr(settings, "FRAME_EVENT_CODEC", "json")
+    payload = _dumps(event, codec)
+    compress_threshold = getattr(settings, "FRAME_EVENT_COMPRESS_THRESHOLD", None)
+    compressed = compress_threshold is not None and len(payload) > compress_threshold
+    if compressed:
+        payload = zlib.compress(payload)
+
+    if codec == "msgpack" or compressed:
+        wire_codec = "msgpack" if codec == "msgpack" else "json"
+        compression = "zlib" if compressed else "none"
+        message = (
+            f"{PREFIX}{wire_codec};{compression};{base64.b64encode(payload).decode()}"
+        )
+    else:
+        message = payload.decode()
+
+    # Offloading is opt-in: a blob store that the workers can't read would
+    # turn messages that fit in SNS into unreadable pointers
+    offload_threshold = getattr(
+        settings, "FRAME_EVENT_OFFLOAD_THRESHOLD", DEFAULT_OFFLOAD_THRESHOLD
+    )
+    if (
+        getattr(settings, "FRAME_EVENT_BLOB_STORE", None)
+        and len(message) > offload_threshold
+    ):
+        key = get_blob_store().put(message.encode())
+        message = json.dumps(
+            {
+                "channel": event.get("channel"),
+                "action": event.get("action"),
+                "blob": key,
+            }
+        )
+    return message
+
+
+def decode_event(message):
+    """
+    Decode a message produced by ``encode_event``.
+
+    :param message: The encoded message.
+    :type message: str
+    :return: The event.
+    :rtype: dict
+    :raises ValueError: If the message cannot be decoded.
+    """
+    if not message.startswith(PREFIX):
+        event = _loads(message, "json")
+        if isinstance(event, dict) and "blob" in event and "data" not in event:
+            return decode_event(get_blob_store().get(event["blob"]).decode())
+        return event
+
+    try:
+        wire_codec, compression, payload = message[len(PREFIX) :].split(";", 2)
+        payload = base64.b64decode(payload)
+        if compression == "zlib":
+            payload = zlib.decompress(payload)
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"Malformed event message: {e}") from e
+    return _loads(payload, wire_codec)
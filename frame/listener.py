@@ -1,21 +1,31 @@
-from aws_utils import listener
+from django.conf import settings
+from frame.aws_utils import listener
 from frame.models import LogMessage
 
 
-@listener("*")
-def log_message_listener(channel, action, data):
+def log_message_listener(events):
     """
     Listener function to log messages to the LogMessage model.
 
     This function listens to all channels and logs the received messages,
     including the channel name, action performed, and data associated with the event.
+    Events arrive in batches and are written with a single ``bulk_create``.
+    It is only registered when ``FRAME_LOG_EVENTS`` is set.
 
-    :param channel: The name of the channel where the event occurred.
-    :type channel: str
-    :param action: The action performed on the channel (e.g., 'created', 'updated', 'deleted').
-    :type action: str
-    :param data: The data associated with the event.
-    :type data: dict
+    :param events: The ``(channel, action, data)`` tuples of the events, where
+        action is the action performed (e.g., 'created', 'updated', 'deleted').
+    :type events: list
     """
-    LogMessage.objects.create(channel=channel, action=action, data=data)
-    print(f"Logged message: {channel} - {action} - {data}")
+    LogMessage.objects.bulk_create(
+        [
+            LogMessage(channel=channel, action=action, message=data)
+            for channel, action, data in events
+        ]
+    )
+    print(f"Logged {len(events)} messages")
+
+
+if getattr(settings, "FRAME_LOG_EVENTS", False):
+    log_message_listener = listener("*", batch_size=500, max_wait=1.0)(
+        log_message_listener
+    )
@@ -0,0 +1,31 @@
+import django
+from frame.management.commands.worker import Command as WorkerCommand
+from frame.transports import get_transport
+
+
+class Command(WorkerCommand):
+    """
+    Django management command to provision the queues used by the worker.
+
+    Creates each channel's queue and subscribes it to the channel, without
+    starting to process messages.
+    """
+
+    help = "Provision SQS queues and SNS subscriptions for the worker"
+
+    def add_arguments(self, parser):
+        pass
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the command execution.
+        """
+        django.setup()
+        self.transport = get_transport()
+        self.load_listeners()
+        self.provision_queues()
+        failed = set(self.get_queue_channels()) - set(self.queue_urls)
+        if failed:
+            self.stdout.write(
+                self.style.ERROR(f"Could not provision: {', '.join(sorted(failed))}")
+            )
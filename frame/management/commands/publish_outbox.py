@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand
+from frame.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    """
+    Django management command to publish events queued in the event outbox.
+
+    Used together with ``FRAME_EVENT_OUTBOX = True``, which makes ``BaseModel``
+    write its events to the outbox instead of publishing them during the request.
+    """
+
+    help = "Publish events from the event outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Maximum number of events to publish per batch",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the outbox once and exit",
+        )
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle the command execution.
+
+        Drains the outbox until it is empty, then sleeps for ``--interval``
+        seconds before checking again.
+        """
+        print("OutboxPublisher: Starting publisher")
+        while True:
+            published = drain_outbox(kwargs["batch_size"])
+            if published:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Published {published} outbox events")
+                )
+                continue
+            if kwargs["once"]:
+                break
+            time.sleep(kwargs["interval"])
@@ -1,52 +1,295 @@
+import argparse
+import signal
+import threading
+from concurrent import futures
 import django
+from django import db
 from django.core.management.base import BaseCommand
-from frame.aws_utils import get_listeners, get_or_create_topic, get_channels
+from frame.aws_utils import (
+    compile_dispatch_table,
+    get_channels,
+    get_shard_channels,
+    is_channel_pattern,
+)
+from frame.codec import decode_event
+from frame.models import BaseModel
+from frame.transports import get_transport
+from frame.worker_utils import (
+    AckBatcher,
+    ListenerDispatcher,
+    MessageDeduplicator,
+    Prefetcher,
+    VisibilityHeartbeat,
+    WorkerSupervisor,
+)
 from importlib import import_module
 from django.apps import apps
 from django.conf import settings
-import json
-import boto3
+
+
+def parse_shards(value):
+    """
+    Parse a list of shard numbers and ranges such as ``"0-3,6"``.
+
+    :param value: The shard list.
+    :type value: str
+    :return: The shard numbers.
+    :rtype: set
+    """
+    shards = set()
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        try:
+            shards.update(range(int(start), int(end or start) + 1))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid shard list: {value}")
+    return shards
 
 
 class Command(BaseCommand):
     """
     Django management command to run an SQS worker.
 
-    This command initializes Django, loads listeners from apps, and processes messages from SQS queues.
+    This command initializes Django, loads listeners from apps, and processes messages from the
+    channel queues of the event transport, SQS by default.
     """
 
     help = "Run SQS worker"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Guards the lazily created helpers shared by the poll threads; some
+        # getters call others, so it is reentrant
+        self.lock = threading.RLock()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes; channels are divided between them",
+        )
+        parser.add_argument(
+            "--threads-per-process",
+            type=int,
+            default=None,
+            help="Number of listener threads in each worker process",
+        )
+        parser.add_argument(
+            "--shards",
+            type=parse_shards,
+            default=None,
+            help="Shards of sharded channels to poll, such as 0-3,6; defaults to all",
+        )
+        parser.add_argument(
+            "--replay-dlq",
+            action="store_true",
+            help="Move dead-lettered messages back to their queues and exit",
+        )
+
     def handle(self, *args, **kwargs):
         """
         Handle the command execution.
 
         This method sets up Django, loads listeners from installed apps, and starts processing messages.
+        With ``--processes`` above one, a supervisor forks that many worker processes instead.
         """
         django.setup()  # Ensure Django is fully initialized
         print("SQSWorker: Starting worker")
-        self.sqs_client = boto3.client("sqs", region_name=settings.AWS_REGION)
-        self.sns_client = boto3.client("sns", region_name=settings.AWS_REGION)
+        self.listener_threads = kwargs["threads_per_process"]
+        self.shards = kwargs["shards"]
+        self.transport = get_transport()
+        self.load_listeners()
+        self.provision_queues()
+        if kwargs["replay_dlq"]:
+            self.replay_dead_letters()
+            return
+
+        if not self.get_queue_channels():
+            self.stdout.write(
+                self.style.ERROR("SQSWorker: No listeners need a queue, not starting")
+            )
+            return
+
+        processes = kwargs["processes"]
+        if processes > 1:
+            # Children must not share the parent's database connections
+            db.connections.close_all()
+            supervisor = WorkerSupervisor(
+                self.run_child, self.assign_channels(processes)
+            )
+            supervisor.run()
+        else:
+            self.process_messages()
+
+    def assign_channels(self, processes):
+        """
+        Divide the channels between worker processes.
+
+        With more processes than channels, channels are shared by several
+        processes, which then compete for the same queue.
+
+        :param processes: The number of worker processes.
+        :type processes: int
+        :return: The channels of each process.
+        :rtype: list
+        """
+        channels = self.get_queue_channels()
+        if not channels:
+            return []
+        if processes <= len(channels):
+            return [channels[i::processes] for i in range(processes)]
+        return [[channels[i % len(channels)]] for i in range(processes)]
+
+    def run_child(self, channels):
+        """
+        Run a forked worker process for the given channels.
+
+        :param channels: The channels this process polls.
+        :type channels: list
+        """
+        self.transport = get_transport()
+        self.process_messages(channels)
+
+    def load_listeners(self):
+        """
+        Import the ``listeners`` or ``listener`` module of every installed app
+        and compile the dispatch table.
+        """
         for app_config in apps.get_app_configs():
-            try:
-                import_module(f"{app_config.name}.listeners")
-                self.stdout.write(
-                    self.style.SUCCESS(f"Loaded listeners for {app_config.name}")
+            for module_name in ("listeners", "listener"):
+                try:
+                    import_module(f"{app_config.name}.{module_name}")
+                    self.stdout.write(
+                        self.style.SUCCESS(f"Loaded listeners for {app_config.name}")
+                    )
+                except ImportError:
+                    pass
+        self.dispatch_table = compile_dispatch_table()
+
+    def get_queue_channels(self):
+        """
+        Get the channels that need their own SQS queue.
+
+        Besides the channels of exact listeners, these are the ``BaseModel``
+        channels matched by pattern listeners, or every ``BaseModel`` channel
+        when a ``"*"`` listener is registered.  Sharded channels are replaced
+        by their shards, limited to those claimed with ``--shards``.
+
+        :return: List of channel names.
+        :rtype: list
+        """
+        channels = [
+            channel
+            for channel in get_channels()
+            if channel != "*" and not is_channel_pattern(channel)
+        ]
+        # Pattern and "*" listeners need the queues of the model channels
+        # they match
+        for model in apps.get_models():
+            channel = model.__name__
+            if (
+                issubclass(model, BaseModel)
+                and channel not in channels
+                and (
+                    self.dispatch_table.wildcard or self.dispatch_table.matches(channel)
                 )
-            except ImportError:
-                pass
+            ):
+                channels.append(channel)
+        shards = getattr(self, "shards", None)
+        return [
+            shard_channel
+            for channel in channels
+            for shard_channel in get_shard_channels(channel, shards)
+        ]
+
+    def provision_queues(self):
+        """
+        Create and subscribe the SQS queue of every channel once, up front.
 
-        self.process_messages()
+        The queue URLs are kept in ``self.queue_urls``, and their channels in
+        ``self.queue_channels``, so the poll loops only receive and delete
+        messages.  Channels that could not be provisioned
+        are retried by their poll loop.
+        """
+        self.queue_urls = {}
+        self.queue_channels = {}
+        for channel in self.get_queue_channels():
+            queue_url = self.get_or_create_queue(channel)
+            if queue_url:
+                self.queue_urls[channel] = queue_url
+                self.queue_channels[queue_url] = channel
+                self.stdout.write(
+                    self.style.SUCCESS(f"Provisioned queue for {channel}")
+                )
 
-    def process_messages(self):
+    def process_messages(self, channels=None):
         """
         Continuously poll SQS queues for messages and process them.
+
+        Every channel's queue gets its own poll loop on a separate thread, so a
+        message waits at most one long poll before it is picked up, however
+        many channels there are.  SIGTERM stops the loops once their current
+        batch has been processed and acknowledged.
+
+        :param channels: The channels to poll, or None for every channel.
+        :type channels: list or None
         """
-        while True:
-            for channel in get_channels():
+        self.stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+        if channels is None:
+            channels = self.get_queue_channels()
+        threads = []
+        for channel in channels:
+            thread = threading.Thread(
+                target=self.poll_channel,
+                args=(channel,),
+                name=f"poll-{channel}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            print("SQSWorker: Stopping worker")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+        self.stop_prefetchers()
+        if hasattr(self, "heartbeat"):
+            self.heartbeat.stop()
+        if hasattr(self, "group_executor"):
+            self.group_executor.shutdown()
+        if hasattr(self, "dispatcher"):
+            self.dispatcher.shutdown()
+
+    def poll_channel(self, channel):
+        """
+        Poll the SQS queue of a single channel until the worker is stopped.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        """
+        while not self.stop_event.is_set():
+            queue_url = self.queue_urls.get(channel)
+            if not queue_url:
                 queue_url = self.get_or_create_queue(channel)
-                if queue_url:
-                    self.poll_queue(queue_url)
+                if not queue_url:
+                    self.stop_event.wait(5)
+                    continue
+                self.queue_urls[channel] = queue_url
+                self.queue_channels[queue_url] = channel
+            try:
+                self.poll_queue(queue_url)
+            except Exception as e:
+                print(f"Error polling SQS queue {channel}: {e}")
+                self.stop_event.wait(5)
+            finally:
+                db.close_old_connections()
 
     def get_or_create_queue(self, channel):
         """
@@ -58,39 +301,7 @@ class Command(BaseCommand):
         :rtype: str or None
         """
         try:
-            queue_name = f"{channel}_queue"
-            response = self.sqs_client.create_queue(QueueName=queue_name)
-            queue_url = response["QueueUrl"]
-            queue_arn = self.sqs_client.get_queue_attributes(
-                QueueUrl=queue_url, AttributeNames=["QueueArn"]
-            )["Attributes"]["QueueArn"]
-
-            topic_arn = get_or_create_topic(channel)
-            if topic_arn:
-                self.sqs_client.set_queue_attributes(
-                    QueueUrl=queue_url,
-                    Attributes={
-                        "Policy": json.dumps(
-                            {
-                                "Version": "2012-10-17",
-                                "Statement": [
-                                    {
-                                        "Effect": "Allow",
-                                        "Principal": "*",
-                                        "Action": "sqs:SendMessage",
-                                        "Resource": queue_arn,
-                                    }
-                                ],
-                            }
-                        )
-                    },
-                )
-
-                self.sns_client.subscribe(
-                    TopicArn=topic_arn, Protocol="sqs", Endpoint=queue_arn
-                )
-
-            return queue_url
+            return self.transport.provision_queue(channel)
         except Exception as e:
             print(f"Error creating/getting SQS queue {channel}: {e}")
             return None
@@ -99,44 +310,496 @@ class Command(BaseCommand):
         """
         Poll the SQS queue for messages and process them.
 
+        The visibility of the messages is extended by heartbeats while they
+        are processed.  With ``FRAME_WORKER_PREFETCH`` set, messages are taken
+        from the queue's prefetch buffer instead of being received here.
+
         :param queue_url: The URL of the SQS queue.
         :type queue_url: str
         """
-        messages = self.sqs_client.receive_message(
-            QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=20
+        prefetcher = self.get_prefetcher(queue_url)
+        if prefetcher:
+            messages = prefetcher.take(max_messages=10, timeout=20)
+        else:
+            messages = self.receive_messages(queue_url)
+        try:
+            self.process_batch(queue_url, messages)
+        finally:
+            self.get_heartbeat().untrack(
+                queue_url, [message["ReceiptHandle"] for message in messages]
+            )
+            if prefetcher:
+                prefetcher.release(len(messages))
+
+    def process_batch(self, queue_url, messages):
+        """
+        Process a batch of received messages and acknowledge those whose
+        listeners finished.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param messages: The received messages.
+        :type messages: list
+        """
+        acks = self.get_ack_batcher(queue_url)
+        completed = {}
+        if messages:
+            completed = self.get_deduplicator().get_completed(
+                [message["MessageId"] for message in messages]
+            )
+        if any(message.get("GroupId") for message in messages):
+            self.process_groups(queue_url, messages, acks, completed)
+        elif messages:
+            # Dispatch the whole batch before waiting so its messages run in parallel
+            dispatched = []
+            for message in messages:
+                try:
+                    calls = self.process_message(
+                        message["Body"], completed.get(message["MessageId"])
+                    )
+                except Exception as e:
+                    # Left unacknowledged, so it is redelivered
+                    print(f"Error dispatching message {message['MessageId']}: {e}")
+                    continue
+                dispatched.append((message, calls))
+            self.flush_batches(
+                [call for _, calls in dispatched if calls for call in calls]
+            )
+            for message, calls in dispatched:
+                self.settle_message(queue_url, message, calls, acks)
+                acks.flush_if_due()
+        # Don't hold acknowledgements through the next long poll
+        acks.flush()
+
+    def receive_messages(self, queue_url, max_messages=10, wait_time=20):
+        """
+        Receive messages from an SQS queue and start their visibility
+        heartbeats.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param max_messages: The maximum number of messages to receive.
+        :type max_messages: int
+        :param wait_time: Seconds to wait for a message.
+        :type wait_time: float
+        :return: The received messages.
+        :rtype: list
+        """
+        messages = self.transport.receive(
+            queue_url, max_messages=max_messages, wait_time=wait_time
         )
+        self.get_heartbeat().track(
+            queue_url, [message["ReceiptHandle"] for message in messages]
+        )
+        return messages
+
+    def get_heartbeat(self):
+        """
+        Get the heartbeat that extends the visibility of in-flight messages.
+
+        Messages are kept hidden for ``FRAME_WORKER_VISIBILITY_TIMEOUT``
+        seconds past each heartbeat.
+
+        :return: The visibility heartbeat.
+        :rtype: VisibilityHeartbeat
+        """
+        with self.lock:
+            if not hasattr(self, "heartbeat"):
+                self.heartbeat = VisibilityHeartbeat(
+                    self.transport,
+                    visibility_timeout=getattr(
+                        settings, "FRAME_WORKER_VISIBILITY_TIMEOUT", 30
+                    ),
+                )
+            return self.heartbeat
+
+    def get_prefetcher(self, queue_url):
+        """
+        Get the prefetch buffer of an SQS queue.
+
+        ``FRAME_WORKER_PREFETCH`` is the high-water mark of messages per queue
+        that are buffered or being processed.  The default of 0 disables
+        prefetching: the next batch is received once the current one is done.
 
-        if "Messages" in messages:
-            for message in messages["Messages"]:
-                body = message["Body"]
-                self.process_message(body)
-                self.sqs_client.delete_message(
-                    QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"]
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :return: The prefetcher, or None if prefetching is disabled.
+        :rtype: Prefetcher or None
+        """
+        high_water = getattr(settings, "FRAME_WORKER_PREFETCH", 0)
+        if not high_water:
+            return None
+        with self.lock:
+            if not hasattr(self, "prefetchers"):
+                self.prefetchers = {}
+            if queue_url not in self.prefetchers:
+                prefetcher = Prefetcher(
+                    lambda max_messages, wait_time: self.receive_messages(
+                        queue_url, max_messages, wait_time
+                    ),
+                    high_water,
                 )
+                prefetcher.start()
+                self.prefetchers[queue_url] = prefetcher
+            return self.prefetchers[queue_url]
 
-    def process_message(self, data):
+    def stop_prefetchers(self):
+        """
+        Stop the prefetch buffers and make the messages still in them visible
+        to other consumers again.
+        """
+        for queue_url, prefetcher in getattr(self, "prefetchers", {}).items():
+            handles = [message["ReceiptHandle"] for message in prefetcher.stop()]
+            self.get_heartbeat().untrack(queue_url, handles)
+            for start in range(0, len(handles), 10):
+                try:
+                    self.transport.change_visibility(
+                        queue_url, handles[start : start + 10], 0
+                    )
+                except Exception as e:
+                    print(f"Error releasing prefetched messages: {e}")
+
+    def process_groups(self, queue_url, messages, acks, completed=None):
+        """
+        Process messages from a FIFO queue, running message groups in parallel
+        and the messages of each group one after another.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param messages: The received messages.
+        :type messages: list
+        :param acks: The acknowledgement batcher of the queue.
+        :type acks: AckBatcher
+        :param completed: The listeners that already processed each message,
+            by message ID.
+        :type completed: dict or None
+        """
+        groups = {}
+        for message in messages:
+            groups.setdefault(message["GroupId"], []).append(message)
+        executor = self.get_group_executor()
+        for future in [
+            executor.submit(self.process_group, queue_url, group, acks, completed)
+            for group in groups.values()
+        ]:
+            future.result()
+
+    def process_group(self, queue_url, messages, acks, completed=None):
+        """
+        Process the messages of one message group in order.
+
+        If a message is to be retried, the rest of the group is left
+        unacknowledged and hidden for the same delay, so it is redelivered
+        after that message.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param messages: The group's messages, in order.
+        :type messages: list
+        :param acks: The acknowledgement batcher of the queue.
+        :type acks: AckBatcher
+        :param completed: The listeners that already processed each message,
+            by message ID.
+        :type completed: dict or None
+        """
+        completed = completed or {}
+        for index, message in enumerate(messages):
+            try:
+                calls = self.process_message(
+                    message["Body"], completed.get(message["MessageId"])
+                )
+            except Exception as e:
+                # Leave the rest of the group to be redelivered after it
+                print(f"Error dispatching message {message['MessageId']}: {e}")
+                return
+            if calls:
+                self.flush_batches(calls)
+            if not self.settle_message(
+                queue_url, message, calls, acks, held=messages[index + 1 :]
+            ):
+                return
+
+    def flush_batches(self, calls):
+        """
+        Run the pending batches of the batch listeners among the given calls.
+
+        Called once a poll batch has been dispatched, so the poll loop, which
+        waits for the calls before its next receive, isn't held for the
+        listeners' ``max_wait``.
+
+        :param calls: Pairs of listener and future, as returned by
+            ``process_message``.
+        :type calls: list
+        """
+        listeners = {listener for listener, _ in calls if listener.batch_size}
+        if listeners:
+            self.get_dispatcher().flush_batches(listeners=listeners)
+
+    def settle_message(self, queue_url, message, calls, acks, held=()):
+        """
+        Wait for a message's listeners, then acknowledge the message, schedule
+        a retry or move it to the dead-letter queue.
+
+        Messages that cannot be decoded are moved to the dead-letter queue
+        straight away.  When a listener fails or times out, the message is
+        hidden for the listener's retry delay and then redelivered, until it
+        has been delivered ``max_attempts`` times.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param message: The received message.
+        :type message: dict
+        :param calls: The listener calls returned by ``process_message``.
+        :type calls: list or None
+        :param acks: The acknowledgement batcher of the queue.
+        :type acks: AckBatcher
+        :param held: Later messages of the message's group, hidden for the
+            same delay when the message is retried.
+        :type held: list
+        :return: True if the message was acknowledged or dead-lettered,
+            False if it will be redelivered.
+        :rtype: bool
+        """
+        if calls is None:
+            return self.dead_letter(queue_url, message, acks)
+        failed = self.wait_for_listeners(calls, message["MessageId"])
+        if not failed:
+            acks.add(message["ReceiptHandle"])
+            return True
+
+        attempt = message.get("ReceiveCount", 1)
+        if attempt >= max(listener.get_max_attempts() for listener in failed):
+            return self.dead_letter(queue_url, message, acks)
+        delay = max(listener.get_retry_delay(attempt) for listener in failed)
+        handles = [message["ReceiptHandle"]] + [
+            held_message["ReceiptHandle"] for held_message in held
+        ]
+        self.get_heartbeat().untrack(queue_url, handles)
+        for start in range(0, len(handles), 10):
+            try:
+                self.transport.change_visibility(
+                    queue_url, handles[start : start + 10], delay
+                )
+            except Exception as e:
+                print(f"Error delaying retry of message {message['MessageId']}: {e}")
+        return False
+
+    def dead_letter(self, queue_url, message, acks):
+        """
+        Move a message to the dead-letter queue of its channel.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :param message: The received message.
+        :type message: dict
+        :param acks: The acknowledgement batcher of the queue.
+        :type acks: AckBatcher
+        :return: True if the message was moved.
+        :rtype: bool
+        """
+        channel = self.queue_channels[queue_url]
+        self.stdout.write(
+            self.style.ERROR(
+                f"Moving message {message['MessageId']} to the dead-letter queue "
+                f"of {channel}"
+            )
+        )
+        try:
+            moved = self.transport.dead_letter(channel, message)
+        except Exception as e:
+            print(f"Error moving message to the dead-letter queue of {channel}: {e}")
+            moved = False
+        if moved:
+            acks.add(message["ReceiptHandle"])
+        return moved
+
+    def replay_dead_letters(self):
+        """
+        Move the messages in every channel's dead-letter queue back to the
+        channel's queue, for example once a failing listener has been fixed.
+
+        Replayed messages keep their message ID, so listeners that already
+        processed them are still skipped.
+        """
+        for channel in self.get_queue_channels():
+            queue_url = self.queue_urls.get(channel)
+            if not queue_url:
+                continue
+            dead_letter_queue = self.transport.dead_letter_queue(channel)
+            replayed = 0
+            while True:
+                messages = self.transport.receive(
+                    dead_letter_queue, max_messages=10, wait_time=1
+                )
+                if not messages:
+                    break
+                failed = set(self.transport.send_batch(queue_url, messages))
+                self.transport.delete_batch(
+                    dead_letter_queue,
+                    [
+                        message["ReceiptHandle"]
+                        for index, message in enumerate(messages)
+                        if index not in failed
+                    ],
+                )
+                replayed += len(messages) - len(failed)
+                if failed:
+                    self.stdout.write(
+                        self.style.ERROR(
+                            f"Could not replay {len(failed)} messages to {channel}"
+                        )
+                    )
+                    break
+            self.stdout.write(
+                self.style.SUCCESS(f"Replayed {replayed} messages to {channel}")
+            )
+
+    def get_group_executor(self):
+        """
+        Get the thread pool that runs the message groups of FIFO queues.
+
+        :return: The thread pool.
+        :rtype: concurrent.futures.ThreadPoolExecutor
+        """
+        with self.lock:
+            if not hasattr(self, "group_executor"):
+                self.group_executor = futures.ThreadPoolExecutor(
+                    self.get_dispatcher().threads, thread_name_prefix="frame-group"
+                )
+            return self.group_executor
+
+    def get_ack_batcher(self, queue_url):
+        """
+        Get the acknowledgement batcher for an SQS queue.
+
+        :param queue_url: The URL of the SQS queue.
+        :type queue_url: str
+        :return: The acknowledgement batcher.
+        :rtype: AckBatcher
+        """
+        with self.lock:
+            if not hasattr(self, "ack_batchers"):
+                self.ack_batchers = {}
+            if queue_url not in self.ack_batchers:
+                self.ack_batchers[queue_url] = AckBatcher(
+                    self.transport,
+                    queue_url,
+                    max_delay=getattr(settings, "FRAME_WORKER_ACK_DELAY", 1.0),
+                )
+            return self.ack_batchers[queue_url]
+
+    def get_dispatcher(self):
+        """
+        Get the dispatcher that runs listeners for this worker.
+
+        :return: The listener dispatcher.
+        :rtype: ListenerDispatcher
+        """
+        with self.lock:
+            if not hasattr(self, "dispatcher"):
+                self.dispatcher = ListenerDispatcher(
+                    threads=getattr(self, "listener_threads", None)
+                    or getattr(settings, "FRAME_WORKER_LISTENER_THREADS", 10)
+                )
+            return self.dispatcher
+
+    def get_deduplicator(self):
+        """
+        Get the record of listeners that have processed each message.
+
+        Configured with ``FRAME_WORKER_DEDUP_CACHE_SIZE``,
+        ``FRAME_WORKER_DEDUP_TTL`` and ``FRAME_WORKER_DEDUP_DATABASE``.
+
+        :return: The message deduplicator.
+        :rtype: MessageDeduplicator
+        """
+        with self.lock:
+            if not hasattr(self, "deduplicator"):
+                self.deduplicator = MessageDeduplicator(
+                    max_size=getattr(settings, "FRAME_WORKER_DEDUP_CACHE_SIZE", 10000),
+                    ttl=getattr(settings, "FRAME_WORKER_DEDUP_TTL", 86400),
+                    use_database=getattr(
+                        settings, "FRAME_WORKER_DEDUP_DATABASE", False
+                    ),
+                )
+            return self.deduplicator
+
+    def wait_for_listeners(self, calls, message_id=None):
+        """
+        Wait for the listener calls of a message to finish.
+
+        Listeners that succeeded are recorded as having processed the
+        message, so they are skipped if it is delivered again.
+
+        :param calls: Pairs of listener and future, as returned by
+            ``process_message``.
+        :type calls: list
+        :param message_id: The ID of the message.
+        :type message_id: str or None
+        :return: The listeners that raised or timed out.
+        :rtype: list
+        """
+        failed = []
+        succeeded = []
+        for listener, future in calls:
+            try:
+                future.result(timeout=listener.timeout)
+                succeeded.append(listener.name)
+            except futures.TimeoutError:
+                self.stdout.write(self.style.ERROR(f"Listener {listener!r} timed out"))
+                failed.append(listener)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f"Error in listener {listener!r}: {e}")
+                )
+                failed.append(listener)
+        if message_id:
+            try:
+                self.get_deduplicator().mark_completed(message_id, succeeded)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f"Error recording processed message: {e}")
+                )
+        return failed
+
+    def process_message(self, data, completed=None):
         """
         Process a message received from the SQS queue.
 
-        :param data: The message data.
+        Every listener of the message's channel is dispatched without waiting
+        for it to finish.
+
+        :param data: The event message, without any transport envelope.
         :type data: str
+        :param completed: Names of listeners that already processed the
+            message and are skipped.
+        :type completed: set or None
+        :return: Pairs of listener and future for the dispatched calls, or
+            None if the message cannot be decoded.
+        :rtype: list or None
         """
         try:
-            message_data = json.loads(data)
-            message_data = json.loads(message_data["Message"])
-            self.stdout.write(self.style.SUCCESS(f"Processing message: {message_data}"))
+            message_data = decode_event(data)
+            if not isinstance(message_data, dict):
+                raise ValueError("The message is not an event")
             channel = message_data.get("channel")
             action = message_data.get("action")
             serialized_data = message_data.get("data")
-            self.stdout.write(
-                self.style.SUCCESS(f"Processing message: {channel} - {action}")
-            )
-
-            listeners = get_listeners(channel)
-            listeners += get_listeners("*")
-            for listener in listeners:
-                listener(channel, action, serialized_data)
-        except json.JSONDecodeError as e:
-            self.stdout.write(self.style.ERROR(f"Failed to decode JSON: {e}"))
+            listeners = self.dispatch_table.get(channel)
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error processing message: {e}"))
+            # Undecodable messages fail on every delivery, so they aren't retried
+            self.stdout.write(self.style.ERROR(f"Failed to decode message: {e}"))
+            return None
+        self.stdout.write(self.style.SUCCESS(f"Processing message: {message_data}"))
+        self.stdout.write(
+            self.style.SUCCESS(f"Processing message: {channel} - {action}")
+        )
+        if completed:
+            listeners = [
+                listener for listener in listeners if listener.name not in completed
+            ]
+        dispatcher = self.get_dispatcher()
+        return [
+            (listener, dispatcher.submit(listener, channel, action, serialized_data))
+            for listener in listeners
+        ]
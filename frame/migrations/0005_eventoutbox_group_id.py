@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("frame", "0004_eventoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventoutbox",
+            name="group_id",
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
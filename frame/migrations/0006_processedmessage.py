@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("frame", "0005_eventoutbox_group_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessedMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("message_id", models.CharField(max_length=128)),
+                ("listener", models.CharField(max_length=255)),
+                (
+                    "processed_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+            ],
+            options={
+                "unique_together": {("message_id", "listener")},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("frame", "0006_processedmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventoutbox",
+            name="next_attempt_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
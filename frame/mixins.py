@@ -1,7 +1,6 @@
 from django.apps import apps
 from django.http import HttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML, CSS
 from django.shortcuts import redirect
 from django.contrib import messages
 from frame.utils import get_child_models, generate_inline_formset
@@ -97,6 +96,10 @@ class ReportMixin:
         """
         Generate PDF from the report template and context.
         """
+        # WeasyPrint and its native libraries are slow to load, so only
+        # import them when a report is actually rendered
+        from weasyprint import CSS, HTML
+
         html_string = render_to_string(self.report_template_name, context)
 
         # Determine the orientation CSS
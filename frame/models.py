@@ -1,13 +1,178 @@
+import copy
 import datetime
+import uuid
 from decimal import Decimal
-import json
-from django.db import models
-from frame.aws_utils import publish_event
-from django.forms.models import model_to_dict
+from django.conf import settings
+from django.db import models, router, transaction
+from django.utils import timezone
+from frame.aws_utils import (
+    get_coalescer,
+    get_shard_channel,
+    publish_event,
+    publish_events,
+)
+from frame.codec import encode_event
+from frame.serializers import get_serializer
+
+# Rows updated and re-read per statement by the event-aware bulk methods
+BULK_EVENT_BATCH_SIZE = 500
+
+# Values that cannot be changed in place, so snapshots can share them
+IMMUTABLE_TYPES = (
+    type(None),
+    bool,
+    int,
+    float,
+    str,
+    bytes,
+    Decimal,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+    uuid.UUID,
+)
+
+
+def _snapshot_value(value):
+    # Copy mutable values, such as JSONField dicts, so in-place changes show up
+    if value is models.DEFERRED or isinstance(value, IMMUTABLE_TYPES):
+        return value
+    return copy.deepcopy(value)
 
 
 # Meta Models
-class BaseModelManager(models.Manager):
+class BaseQuerySet(models.QuerySet):
+    """
+    QuerySet with bulk operations that publish model events.
+
+    Like Django's, ``bulk_create``, ``bulk_update`` and ``update`` publish no
+    events.  The ``*_with_events`` variants and ``soft_delete`` do the same
+    set-based work and publish one event per row in batches, written to the
+    outbox with a single INSERT when ``FRAME_EVENT_OUTBOX`` is set.
+    """
+
+    def bulk_create_with_events(self, objs, batch_size=None, **kwargs):
+        """
+        Insert several instances and publish a "created" event for each.
+
+        Events carry the pks only on databases that return them from bulk
+        inserts, such as PostgreSQL and SQLite.
+
+        :param objs: The instances to insert.
+        :type objs: iterable
+        :param batch_size: The number of rows per INSERT.
+        :type batch_size: int or None
+        :return: The inserted instances.
+        :rtype: list
+        """
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            objs = self.bulk_create(objs, batch_size=batch_size, **kwargs)
+            serializer = get_serializer(self.model)
+            emit_events(
+                self.model,
+                "created",
+                [serializer.serialize(obj) for obj in objs],
+                self.db,
+            )
+        for obj in objs:
+            obj._snapshot()
+        return objs
+
+    def bulk_update_with_events(self, objs, fields, batch_size=None):
+        """
+        Update fields of several instances and publish an "updated" event for each.
+
+        ``updated_at`` is set on every instance, as ``save()`` would.  With
+        ``delta_events`` in the model configuration, events only carry the
+        updated fields and the pk.
+
+        :param objs: The instances to update.
+        :type objs: iterable
+        :param fields: The names of the fields to update.
+        :type fields: list
+        :param batch_size: The number of rows per UPDATE.
+        :type batch_size: int or None
+        :return: The number of rows updated.
+        :rtype: int
+        """
+        objs = list(objs)
+        fields = list(fields)
+        if "updated_at" not in fields:
+            fields.append("updated_at")
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            rows = self.bulk_update(objs, fields, batch_size=batch_size)
+            serializer = get_serializer(self.model)
+            emit_events(
+                self.model,
+                "updated",
+                [serializer.serialize(obj) for obj in objs],
+                self.db,
+                fields=(
+                    fields
+                    if self.model.get_event_config().get("delta_events")
+                    else None
+                ),
+            )
+        for obj in objs:
+            obj._snapshot()
+        return rows
+
+    def update_with_events(self, **kwargs):
+        """
+        Update the rows of the queryset and publish an "updated" event for each.
+
+        The matching pks are read first, then updated and read back in
+        batches of ``BULK_EVENT_BATCH_SIZE``, so events carry the stored
+        values even when ``F()`` expressions are used.
+
+        :return: The number of rows updated.
+        :rtype: int
+        """
+        fields = None
+        if self.model.get_event_config().get("delta_events"):
+            fields = list(kwargs) + ["updated_at"]
+        return self._update_with_events("updated", kwargs, fields)
+
+    def soft_delete(self):
+        """
+        Mark the rows of the queryset as deleted and publish a "deleted" event for each.
+
+        :return: The number of rows deleted.
+        :rtype: int
+        """
+        return self._update_with_events("deleted", {"is_deleted": True})
+
+    def _update_with_events(self, action, values, fields=None):
+        values = {"updated_at": timezone.now(), **values}
+        self._for_write = True
+        using = self.db
+        updated = 0
+        with transaction.atomic(using=using):
+            pks = list(self.values_list("pk", flat=True))
+            # Re-read through the base manager so soft deleted rows are included
+            queryset = self.model._base_manager.using(using)
+            for start in range(0, len(pks), BULK_EVENT_BATCH_SIZE):
+                batch = queryset.filter(
+                    pk__in=pks[start : start + BULK_EVENT_BATCH_SIZE]
+                )
+                updated += batch.update(**values)
+                emit_events(
+                    self.model,
+                    action,
+                    get_serializer(self.model).serialize_many(batch),
+                    using,
+                    fields=fields,
+                )
+        return updated
+
+
+class BaseModelManager(models.Manager.from_queryset(BaseQuerySet)):
     """
     Custom manager to filter out deleted objects.
     """
@@ -29,56 +194,189 @@ class BaseModel(models.Model):
     is_deleted = models.BooleanField(default=False)
 
     objects = BaseModelManager()
-    all_objects = models.Manager()  # Manager that includes deleted objects
+    all_objects = BaseQuerySet.as_manager()  # Manager that includes deleted objects
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Create an instance loaded from the database and snapshot its values.
+
+        The snapshot is a tuple aligned with ``_meta.concrete_fields``;
+        deferred fields hold ``DEFERRED``.  Mutable values are copied.
+        """
+        instance = super().from_db(db, field_names, values)
+        if len(values) == len(cls._meta.concrete_fields):
+            instance._loaded_values = tuple(_snapshot_value(value) for value in values)
+        else:
+            loaded = dict(zip(field_names, values))
+            instance._loaded_values = tuple(
+                _snapshot_value(loaded.get(field.attname, models.DEFERRED))
+                for field in cls._meta.concrete_fields
+            )
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        """
+        Reload field values from the database and snapshot them as the saved values.
+        """
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot(fields)
+
+    def get_dirty_fields(self):
+        """
+        Get the fields changed since the instance was loaded or last saved.
+
+        :return: The names of the changed fields, or None if the instance has
+            no snapshot to compare with.
+        :rtype: list or None
+        """
+        loaded_values = getattr(self, "_loaded_values", None)
+        if loaded_values is None:
+            return None
+        dirty = []
+        for field, loaded in zip(self._meta.concrete_fields, loaded_values):
+            # Read __dict__ so deferred fields are not fetched
+            current = self.__dict__.get(field.attname, models.DEFERRED)
+            if current is models.DEFERRED:
+                continue
+            if loaded is models.DEFERRED or current != loaded:
+                dirty.append(field.name)
+        return dirty
+
+    def _snapshot(self, fields=None):
+        """
+        Record the current field values as the saved ones.
+
+        :param fields: Only record these fields, as saved with ``update_fields``.
+        :type fields: list or None
+        """
+        concrete_fields = self._meta.concrete_fields
+        loaded_values = getattr(self, "_loaded_values", None) or (
+            (models.DEFERRED,) * len(concrete_fields)
+        )
+        self._loaded_values = tuple(
+            (
+                _snapshot_value(self.__dict__.get(field.attname, models.DEFERRED))
+                if fields is None or field.name in fields or field.attname in fields
+                else loaded
+            )
+            for field, loaded in zip(concrete_fields, loaded_values)
+        )
+
+    @classmethod
+    def get_event_config(cls):
+        """
+        Get the event options from the model configuration.
+
+        :return: The model configuration, or an empty dict for models without one.
+        :rtype: dict
+        """
+        if hasattr(cls, "get_config"):
+            return cls.get_config()
+        return {}
 
     def save(self, *args, **kwargs):
         """
         Override save method to publish create or update events.
+
+        Models can set ``delta_events`` in their configuration so "updated"
+        events only carry the changed fields and the pk, and
+        ``skip_unchanged_saves`` to skip both the UPDATE and the event when
+        no field changed.
         """
         is_new_instance = not self.pk
-        super().save(
-            *args, **kwargs
-        )  # Save first to ensure we have an ID for new instances
+        config = self.get_event_config()
+        dirty_fields = None if is_new_instance else self.get_dirty_fields()
+        if (
+            dirty_fields is not None
+            and not dirty_fields
+            and config.get("skip_unchanged_saves")
+        ):
+            return
+        using = kwargs.get("using") or router.db_for_write(
+            self.__class__, instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(
+                *args, **kwargs
+            )  # Save first to ensure we have an ID for new instances
 
-        event_data = {
-            "channel": self.__class__.__name__,
-            "action": "created" if is_new_instance else "updated",
-            "data": self.serialize(),
-        }
-        publish_event(self.__class__.__name__, json.dumps(event_data))
+            if dirty_fields is not None and config.get("delta_events"):
+                self.emit_event("updated", using, fields=dirty_fields)
+            else:
+                self.emit_event("created" if is_new_instance else "updated", using)
+        self._snapshot(kwargs.get("update_fields"))
 
     def delete(self, *args, **kwargs):
         """
-        Override delete method to perform a soft delete and publish delete events.
+        Override delete method to perform a soft delete and publish a "deleted" event.
+
+        Only ``is_deleted`` and ``updated_at`` are written, and no "updated"
+        event is published.
+        """
+        using = kwargs.get("using") or router.db_for_write(
+            self.__class__, instance=self
+        )
+        update_fields = ["is_deleted", "updated_at"]
+        with transaction.atomic(using=using):
+            self.is_deleted = True
+            super().save(using=using, update_fields=update_fields)
+            self.emit_event("deleted", using)
+        self._snapshot(update_fields)
+
+    def emit_event(self, action, using=None, fields=None):
         """
-        self.is_deleted = True
-        self.save(*args, **kwargs)  # Pass args and kwargs to save
+        Publish an event for this instance.
 
+        Models can set ``event_coalesce_window`` in their configuration to
+        collapse "updated" events for the same instance published within that
+        many seconds into one event carrying the final state.  A "deleted"
+        event supersedes pending updates.  Events of sharded channels are
+        published to the instance's shard.
+
+        :param action: The action performed ('created', 'updated', 'deleted').
+        :type action: str
+        :param using: The database alias the change was written to.
+        :type using: str or None
+        :param fields: Only include these fields and the pk in the event data.
+            Ignored for coalesced events, which carry the full final state.
+        :type fields: list or None
+        """
+        channel = self.__class__.__name__
+        coalesce_window = None
+        if action != "created":
+            coalesce_window = self.get_event_config().get("event_coalesce_window")
+        data = self.serialize()
+        if fields is not None and not coalesce_window:
+            pk_name = self._meta.pk.name
+            data = {
+                name: value
+                for name, value in data.items()
+                if name == pk_name or name in fields
+            }
+        # A unique id keeps FIFO content-based deduplication from dropping
+        # a later event with the same data, such as a change back to an
+        # earlier value
         event_data = {
-            "channel": self.__class__.__name__,
-            "action": "deleted",
-            "data": self.serialize(),
+            "id": uuid.uuid4().hex,
+            "channel": channel,
+            "action": action,
+            "data": data,
         }
-        publish_event(self.__class__.__name__, json.dumps(event_data))
+        dispatch_event(
+            get_shard_channel(channel, self.pk),
+            encode_event(event_data),
+            using,
+            coalesce_key=self.pk if coalesce_window else None,
+            coalesce_window=coalesce_window if action == "updated" else None,
+            group_id=f"{channel}:{self.pk}",
+        )
 
     def serialize(self):
         """
         Serialize the model instance into a JSON serializable dictionary.
         """
-
-        def convert_to_serializable(value):
-            if isinstance(value, datetime.datetime):
-                return value.isoformat()
-            elif isinstance(value, datetime.date):
-                return value.isoformat()
-            elif isinstance(value, Decimal):
-                return float(value)
-            return value
-
-        data = model_to_dict(self)
-        data = {k: convert_to_serializable(v) for k, v in data.items()}
-
-        return data
+        return get_serializer(type(self)).serialize(self)
 
     class Meta:
         abstract = True
@@ -95,3 +393,157 @@ class LogMessage(BaseModel):
 
     def __str__(self):
         return f"{self.channel} - {self.action}"
+
+
+class EventOutbox(models.Model):
+    """
+    Events waiting to be published by the ``publish_outbox`` command.
+
+    Rows are written in the same transaction as the model change that produced
+    them, so an event is only published if that change is committed.
+    """
+
+    channel = models.CharField(max_length=255)
+    message = models.TextField()
+    group_id = models.CharField(max_length=128, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.channel} - {self.pk}"
+
+
+class ProcessedMessage(models.Model):
+    """
+    Listeners that have finished processing a received message.
+
+    Used by the worker, with ``FRAME_WORKER_DEDUP_DATABASE = True``, to skip
+    listeners that already ran when a message is delivered again.
+    """
+
+    message_id = models.CharField(max_length=128)
+    listener = models.CharField(max_length=255)
+    processed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("message_id", "listener")
+
+    def __str__(self):
+        return f"{self.message_id} - {self.listener}"
+
+
+def dispatch_event(
+    channel,
+    message,
+    using=None,
+    coalesce_key=None,
+    coalesce_window=None,
+    group_id=None,
+):
+    """
+    Publish an event, or queue it in the outbox when ``FRAME_EVENT_OUTBOX`` is set.
+
+    Without the outbox the event is published once the current transaction
+    commits, so rolled back changes never produce events.  Outbox events are
+    never coalesced.
+
+    :param channel: The name of the channel.
+    :type channel: str
+    :param message: The encoded event message.
+    :type message: str
+    :param using: The database alias the event's change was written to.
+    :type using: str or None
+    :param coalesce_key: The key of the instance the event is about. Pending
+        coalesced events for the key are dropped when this event is published.
+    :type coalesce_key: object
+    :param coalesce_window: Hold the event for this many seconds, replacing it
+        with any later event for the same key.
+    :type coalesce_window: float or None
+    :param group_id: The message group of the event on FIFO channels.
+    :type group_id: str or None
+    """
+    if getattr(settings, "FRAME_EVENT_OUTBOX", False):
+        EventOutbox.objects.using(using).create(
+            channel=channel, message=message, group_id=group_id
+        )
+        return
+
+    def publish():
+        if coalesce_window:
+            get_coalescer().add(
+                channel, coalesce_key, message, coalesce_window, group_id=group_id
+            )
+            return
+        if coalesce_key is not None:
+            get_coalescer().discard(channel, coalesce_key)
+        publish_event(channel, message, group_id=group_id)
+
+    transaction.on_commit(publish, using=using)
+
+
+def emit_events(model, action, rows, using=None, fields=None):
+    """
+    Publish an event for each of several serialized rows of a model.
+
+    Events are grouped by shard channel and published in batches once the
+    current transaction commits, or written to the outbox with one INSERT
+    when ``FRAME_EVENT_OUTBOX`` is set.  They are never coalesced, but
+    pending coalesced events for the rows are dropped.
+
+    :param model: The model class.
+    :type model: type
+    :param action: The action performed ('created', 'updated', 'deleted').
+    :type action: str
+    :param rows: The serialized rows.
+    :type rows: list
+    :param using: The database alias the changes were written to.
+    :type using: str or None
+    :param fields: Only include these fields and the pk in the event data.
+    :type fields: list or None
+    """
+    channel = model.__name__
+    pk_name = model._meta.pk.name
+    batches = {}
+    for data in rows:
+        pk = data.get(pk_name)
+        if fields is not None:
+            data = {
+                name: value
+                for name, value in data.items()
+                if name == pk_name or name in fields
+            }
+        message = encode_event(
+            {"id": uuid.uuid4().hex, "channel": channel, "action": action, "data": data}
+        )
+        batches.setdefault(get_shard_channel(channel, pk), []).append(
+            (pk, message, f"{channel}:{pk}")
+        )
+    if not batches:
+        return
+
+    if getattr(settings, "FRAME_EVENT_OUTBOX", False):
+        EventOutbox.objects.using(using).bulk_create(
+            EventOutbox(channel=shard, message=message, group_id=group_id)
+            for shard, events in batches.items()
+            for _, message, group_id in events
+        )
+        return
+
+    coalesced = bool(model.get_event_config().get("event_coalesce_window"))
+
+    def publish():
+        for shard, events in batches.items():
+            if coalesced:
+                coalescer = get_coalescer()
+                for pk, _, _ in events:
+                    coalescer.discard(shard, pk)
+            failed = publish_events(
+                shard,
+                [message for _, message, _ in events],
+                group_ids=[group_id for _, _, group_id in events],
+            )
+            if failed:
+                print(f"Failed to publish {len(failed)} {action} events to {shard}")
+
+    transaction.on_commit(publish, using=using)
@@ -0,0 +1,124 @@
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from frame.aws_utils import publish_events
+from frame.models import EventOutbox
+
+
+def get_retry_delay(attempts):
+    """
+    Get how long a failed outbox row waits before it is published again.
+
+    The delay doubles with every attempt, up to ``FRAME_OUTBOX_MAX_BACKOFF``
+    seconds (default 300).
+
+    :param attempts: The number of failed attempts so far.
+    :type attempts: int
+    :return: The delay.
+    :rtype: datetime.timedelta
+    """
+    max_backoff = getattr(settings, "FRAME_OUTBOX_MAX_BACKOFF", 300)
+    return datetime.timedelta(seconds=min(2 ** min(attempts, 16), max_backoff))
+
+
+def drain_outbox(batch_size=100):
+    """
+    Publish a batch of pending outbox events and remove the published rows.
+
+    Rows are locked with ``SKIP LOCKED`` where the database supports it, so
+    several publishers can drain the outbox at the same time.  Events are
+    published per channel in the order they were written.
+
+    Rows that fail are retried after a growing delay, so they don't hold up
+    the rows behind them.  With ``FRAME_OUTBOX_MAX_ATTEMPTS`` set, rows are
+    parked, left in the table but no longer published, after that many
+    attempts.  The rows of a message group are published in order: nothing
+    after a row that is waiting to be retried or parked is published.
+
+    :param batch_size: The maximum number of events to publish.
+    :type batch_size: int
+    :return: The number of events published.
+    :rtype: int
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, "FRAME_OUTBOX_MAX_ATTEMPTS", None)
+    with transaction.atomic():
+        pending = EventOutbox.objects.filter(next_attempt_at__lte=now)
+        if max_attempts:
+            pending = pending.filter(attempts__lt=max_attempts)
+        rows = list(
+            pending.select_for_update(skip_locked=True).order_by("pk")[:batch_size]
+        )
+        if not rows:
+            return 0
+        rows = _skip_blocked_groups(rows)
+
+        # Publish the n-th row of every group in round n, so a failure can
+        # stop the rest of its group without holding back other groups
+        rounds = []
+        positions = {}
+        for row in rows:
+            position = 0
+            if row.group_id:
+                position = positions.get(row.group_id, 0)
+                positions[row.group_id] = position + 1
+            if position == len(rounds):
+                rounds.append([])
+            rounds[position].append(row)
+
+        published, failed_groups = [], set()
+        for round_rows in rounds:
+            by_channel = {}
+            for row in round_rows:
+                if row.group_id not in failed_groups:
+                    by_channel.setdefault(row.channel, []).append(row)
+            for channel, channel_rows in by_channel.items():
+                failed_indexes = set(
+                    publish_events(
+                        channel,
+                        [row.message for row in channel_rows],
+                        group_ids=[row.group_id for row in channel_rows],
+                    )
+                )
+                for index, row in enumerate(channel_rows):
+                    if index in failed_indexes:
+                        _retry_later(row, now, max_attempts)
+                        if row.group_id:
+                            failed_groups.add(row.group_id)
+                    else:
+                        published.append(row.pk)
+
+        EventOutbox.objects.filter(pk__in=published).delete()
+    return len(published)
+
+
+def _skip_blocked_groups(rows):
+    # Earlier rows of a group that were not selected are waiting to be
+    # retried, parked or locked by another publisher
+    group_ids = {row.group_id for row in rows if row.group_id}
+    if not group_ids:
+        return rows
+    blocked = {}
+    for group_id, pk in (
+        EventOutbox.objects.filter(group_id__in=group_ids, pk__lt=rows[-1].pk)
+        .exclude(pk__in=[row.pk for row in rows])
+        .values_list("group_id", "pk")
+    ):
+        blocked[group_id] = min(pk, blocked.get(group_id, pk))
+    return [
+        row
+        for row in rows
+        if row.group_id not in blocked or row.pk < blocked[row.group_id]
+    ]
+
+
+def _retry_later(row, now, max_attempts):
+    attempts = row.attempts + 1
+    EventOutbox.objects.filter(pk=row.pk).update(
+        attempts=attempts, next_attempt_at=now + get_retry_delay(attempts)
+    )
+    if max_attempts and attempts >= max_attempts:
+        print(
+            f"Parked outbox event {row.pk} on {row.channel} after {attempts} attempts"
+        )
@@ -0,0 +1,289 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+SPILL = "spill"
+
+
+class AsyncPublisher:
+    """
+    Publish events from a bounded in-process queue on background threads.
+
+    ``submit`` returns as soon as the event is queued.  When the queue is full
+    the ``full_policy`` decides what happens:
+
+    * ``block``: wait until a publisher thread frees a slot.
+    * ``drop_oldest``: discard the oldest queued event to make room.
+    * ``spill``: append the event to a file of this process,
+      ``{spill_path}.{pid}``; publisher threads pick spilled events up again
+      once they are idle.  Files left behind by processes that have exited
+      are replayed when a publisher starts.  Unreadable lines are moved to
+      ``{spill_path}.corrupt``.
+    """
+
+    def __init__(
+        self, publish, max_size=10000, threads=4, full_policy=BLOCK, spill_path=None
+    ):
+        if full_policy not in (BLOCK, DROP_OLDEST, SPILL):
+            raise ValueError(f"Unknown queue full policy: {full_policy}")
+        if full_policy == SPILL and not spill_path:
+            raise ValueError("The spill policy requires a spill_path")
+        self.publish = publish
+        self.threads = threads
+        self.full_policy = full_policy
+        self.spill_path = spill_path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._spill_lock = threading.Lock()
+        self._workers = []
+
+    def start(self):
+        """
+        Start the publisher threads.
+        """
+        for i in range(self.threads):
+            worker = threading.Thread(
+                target=self._run, name=f"frame-publisher-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        if self.spill_path and os.name == "posix":
+            threading.Thread(
+                target=self._recover_spill_files,
+                name="frame-spill-recovery",
+                daemon=True,
+            ).start()
+
+    def submit(self, channel, message):
+        """
+        Queue an event for publishing.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param message: The message to publish.
+        :type message: str
+        """
+        item = (channel, message)
+        if self.full_policy == BLOCK:
+            self._queue.put(item)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                if self.full_policy == SPILL:
+                    self._spill(item)
+                    return
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued event has been published.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: float or None
+        :return: True if the queue was drained, False if the timeout expired.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if deadline is None:
+                    self._queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                channel, message = self._queue.get(timeout=1)
+            except queue.Empty:
+                try:
+                    self._drain_spill()
+                except Exception as e:
+                    print(f"Error replaying spilled events: {e}")
+                continue
+            try:
+                self.publish(channel, message)
+            except Exception as e:
+                print(f"Error publishing event to {channel}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _get_spill_file(self):
+        # One file per process, since only this process's lock guards the
+        # appends and renames
+        return f"{self.spill_path}.{os.getpid()}"
+
+    def _spill(self, item):
+        line = json.dumps({"channel": item[0], "message": item[1]})
+        with self._spill_lock:
+            with open(self._get_spill_file(), "a") as spill_file:
+                spill_file.write(line + "\n")
+
+    def _drain_spill(self):
+        if not self.spill_path:
+            return
+        spill_file = self._get_spill_file()
+        draining_path = f"{spill_file}.{threading.get_ident()}"
+        with self._spill_lock:
+            try:
+                os.replace(spill_file, draining_path)
+            except FileNotFoundError:
+                return
+        self._replay(draining_path)
+
+    def _recover_spill_files(self):
+        # Files are named {spill_path}.{pid}[.{suffix}] by the process that
+        # owns them; take over those of processes that are no longer running
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.*"):
+            pid = path[len(self.spill_path) + 1 :].split(".")[0]
+            if not pid.isdigit() or _is_running(int(pid)):
+                continue
+            recovering_path = f"{self._get_spill_file()}.recovered-{pid}"
+            try:
+                os.replace(path, recovering_path)
+            except FileNotFoundError:
+                continue  # Recovered by another process
+            try:
+                self._replay(recovering_path)
+            except Exception as e:
+                print(f"Error replaying spill file {path}: {e}")
+
+    def _replay(self, path):
+        # A crash can leave a partly written last line; such lines are moved
+        # to {spill_path}.corrupt instead of stopping the replay
+        with open(path) as spill_file:
+            for line in spill_file:
+                try:
+                    item = json.loads(line)
+                    channel, message = item["channel"], item["message"]
+                except (ValueError, TypeError, KeyError):
+                    self._quarantine(line)
+                    continue
+                try:
+                    self.publish(channel, message)
+                except Exception as e:
+                    print(f"Error publishing spilled event to {channel}: {e}")
+        os.remove(path)
+
+    def _quarantine(self, line):
+        corrupt_path = f"{self.spill_path}.corrupt"
+        print(f"Moving an unreadable spilled event to {corrupt_path}")
+        with self._spill_lock:
+            with open(corrupt_path, "a") as corrupt_file:
+                corrupt_file.write(line if line.endswith("\n") else line + "\n")
+
+
+def _is_running(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class EventCoalescer:
+    """
+    Collapse rapid successive events for the same key into one.
+
+    The first event for a key starts a window of ``window`` seconds.  Later
+    events for the key replace the pending one, and the last event is
+    published when the window closes.
+    """
+
+    def __init__(self, publish):
+        self.publish = publish
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add(self, channel, key, message, window, group_id=None):
+        """
+        Hold an event until its coalescing window closes.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param key: The key events are coalesced on, such as the instance's pk.
+        :type key: object
+        :param message: The message to publish.
+        :type message: str
+        :param window: Seconds to wait for further events for the key.
+        :type window: float
+        :param group_id: The message group of the event on FIFO channels.
+        :type group_id: str or None
+        """
+        with self._condition:
+            entry = self._pending.get((channel, key))
+            deadline = entry[1] if entry else time.monotonic() + window
+            self._pending[(channel, key)] = (message, deadline, group_id)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="frame-coalescer", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def discard(self, channel, key):
+        """
+        Drop the pending event for a key, for example because it was deleted.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param key: The key events are coalesced on.
+        :type key: object
+        """
+        with self._condition:
+            self._pending.pop((channel, key), None)
+
+    def flush(self):
+        """
+        Publish every pending event now.
+        """
+        with self._condition:
+            pending, self._pending = self._pending, {}
+        for (channel, _), (message, _, group_id) in pending.items():
+            self.publish(channel, message, group_id)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                now = time.monotonic()
+                due = [
+                    key
+                    for key, (_, deadline, _) in self._pending.items()
+                    if deadline <= now
+                ]
+                ready = [(key[0], self._pending.pop(key)) for key in due]
+                if not ready:
+                    next_deadline = min(
+                        deadline for _, deadline, _ in self._pending.values()
+                    )
+                    self._condition.wait(next_deadline - now)
+                    continue
+            for channel, (message, _, group_id) in ready:
+                try:
+                    self.publish(channel, message, group_id)
+                except Exception as e:
+                    print(f"Error publishing coalesced event to {channel}: {e}")
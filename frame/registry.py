@@ -0,0 +1,159 @@
+"""
+Compiled view metadata of the models configured with ``get_config``.
+
+Each model's configuration is resolved once per view type into immutable
+tuples, when the app registry is ready, so views don't rebuild field lists on
+every request.  With ``DEBUG`` on, the registry is reset at the start of every
+request, so configuration changes show up without restarting the server.
+"""
+
+import collections
+import types
+from django.apps import apps
+
+VIEW_TYPES = ("list", "detail", "form")
+
+
+class ViewMetadata(
+    collections.namedtuple(
+        "ViewMetadata",
+        ["fields", "properties", "enabled_fields", "display_fields", "editable_fields"],
+    )
+):
+    """
+    The resolved configuration of a model for one view type.
+
+    - ``fields``: the enabled model fields, in configuration order.
+    - ``properties``: the enabled properties.
+    - ``enabled_fields``: the fields followed by the properties.
+    - ``display_fields``: ``enabled_fields`` without ``pk``.
+    - ``editable_fields``: a read-only mapping of the fields editable in the
+      list view to their field type.
+    """
+
+    __slots__ = ()
+
+
+_properties = {}
+
+
+def get_model_properties(model):
+    """
+    Get the names of a model's properties, finding them on first use.
+
+    The class ``__dict__`` of each class in the MRO is read once, rather than
+    looking up every attribute of the model with ``dir`` and ``getattr``.
+    An attribute counts if the first class defining it defines a property.
+
+    :param model: The model class.
+    :type model: type
+    :return: The property names, sorted.
+    :rtype: tuple
+    """
+    properties = _properties.get(model)
+    if properties is None:
+        attributes = {}
+        for cls in reversed(model.__mro__):
+            attributes.update(cls.__dict__)
+        properties = _properties[model] = tuple(
+            sorted(
+                name
+                for name, value in attributes.items()
+                if isinstance(value, property)
+            )
+        )
+    return properties
+
+
+def compile_view_metadata(model, view_type):
+    """
+    Resolve the configuration of a model for a view type.
+
+    :param model: The model class.
+    :type model: type
+    :param view_type: The type of view ('list', 'detail', 'form').
+    :type view_type: str
+    :return: The view metadata.
+    :rtype: ViewMetadata
+    """
+    config = model.get_config()
+    model_field_names = {field.name for field in model._meta.get_fields()}
+    fields = []
+    editable_fields = {}
+    for field_config in config.get("fields", ()):
+        name = field_config["name"]
+        if name not in model_field_names:
+            continue
+        field = model._meta.get_field(name)
+        if field.auto_created or field.one_to_one or field.many_to_many:
+            continue
+        if field_config.get(f"enable_in_{view_type}") and name != "is_deleted":
+            fields.append(name)
+        if view_type == "list" and field_config.get("editable_in_list"):
+            field_type = field.get_internal_type()
+            if field_type == "CharField" and field.choices:
+                field_type = "ChoiceField"
+            editable_fields[name] = field_type
+
+    properties = ()
+    if view_type != "form" and "props" in config:
+        prop_names = {prop["name"] for prop in config["props"]}
+        properties = tuple(
+            name
+            for name in get_model_properties(model)
+            if name in prop_names and name != "is_deleted"
+        )
+
+    enabled_fields = tuple(fields) + properties
+    return ViewMetadata(
+        fields=tuple(fields),
+        properties=properties,
+        enabled_fields=enabled_fields,
+        display_fields=tuple(name for name in enabled_fields if name != "pk"),
+        editable_fields=types.MappingProxyType(editable_fields),
+    )
+
+
+_registry = {}
+
+
+def get_view_metadata(model, view_type="list"):
+    """
+    Get the compiled metadata of a model for a view type, compiling it on first use.
+
+    :param model: The model class.
+    :type model: type
+    :param view_type: The type of view ('list', 'detail', 'form').
+    :type view_type: str
+    :return: The view metadata.
+    :rtype: ViewMetadata
+    """
+    metadata = _registry.get((model, view_type))
+    if metadata is None:
+        metadata = _registry[(model, view_type)] = compile_view_metadata(
+            model, view_type
+        )
+    return metadata
+
+
+def compile_registry():
+    """
+    Compile the metadata of every installed model with a ``get_config`` method.
+
+    Called from ``FrameConfig.ready`` so the first request doesn't pay for it.
+    """
+    for model in apps.get_models():
+        if hasattr(model, "get_config"):
+            for view_type in VIEW_TYPES:
+                get_view_metadata(model, view_type)
+
+
+def reload_registry(**kwargs):
+    """
+    Forget the compiled metadata, so it is compiled again from ``get_config``.
+
+    Connected to ``request_started`` when ``DEBUG`` is on.  Call it after
+    changing a model configuration at runtime.  Property names are kept,
+    since they only change with the model's code.
+    """
+    _registry.clear()
@@ -0,0 +1,139 @@
+import datetime
+from decimal import Decimal
+from operator import attrgetter
+from django.apps import apps
+from django.db import models
+
+
+def _isoformat(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _to_float(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _to_str(value):
+    if value is None:
+        return value
+    return str(value)
+
+
+def get_converter(field):
+    """
+    Choose the function that makes a field's values JSON serializable.
+
+    :param field: The model field.
+    :type field: django.db.models.Field
+    :return: The converter, or None if values can be used as they are.
+    :rtype: function or None
+    """
+    if isinstance(field, (models.DateField, models.TimeField)):
+        return _isoformat
+    if isinstance(field, models.DecimalField):
+        return _to_float
+    if isinstance(field, models.UUIDField):
+        return _to_str
+    return None
+
+
+class ModelSerializer:
+    """
+    Serialize instances of a model into JSON serializable dictionaries.
+
+    The field names, the attribute getter and the converters are worked out
+    once from ``_meta.concrete_fields``.  The keys match ``model_to_dict``:
+    every editable concrete field, with foreign keys as their raw ids.
+    """
+
+    def __init__(self, model):
+        fields = [field for field in model._meta.concrete_fields if field.editable]
+        self.model = model
+        self.names = tuple(field.name for field in fields)
+        self.attnames = tuple(field.attname for field in fields)
+        self.converters = tuple(
+            (index, converter)
+            for index, converter in enumerate(get_converter(field) for field in fields)
+            if converter
+        )
+        getter = attrgetter(*self.attnames) if self.attnames else lambda _: ()
+        if len(self.attnames) == 1:
+            self._get_values = lambda instance: (getter(instance),)
+        else:
+            self._get_values = getter
+
+    def serialize(self, instance):
+        """
+        Serialize a model instance.
+
+        :param instance: The model instance.
+        :type instance: django.db.models.Model
+        :return: The serialized instance.
+        :rtype: dict
+        """
+        return self._to_dict(self._get_values(instance))
+
+    def serialize_many(self, queryset):
+        """
+        Serialize the rows of a queryset without instantiating models.
+
+        :param queryset: The queryset to serialize.
+        :type queryset: django.db.models.QuerySet
+        :return: The serialized rows.
+        :rtype: list
+        """
+        return [self._to_dict(row) for row in queryset.values_list(*self.attnames)]
+
+    def _to_dict(self, values):
+        if self.converters:
+            values = list(values)
+            for index, converter in self.converters:
+                values[index] = converter(values[index])
+        return dict(zip(self.names, values))
+
+
+_serializers = {}
+
+
+def get_serializer(model):
+    """
+    Get the serializer for a model, compiling it on first use.
+
+    :param model: The model class.
+    :type model: type
+    :return: The model's serializer.
+    :rtype: ModelSerializer
+    """
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = ModelSerializer(model)
+    return serializer
+
+
+def serialize_many(queryset):
+    """
+    Serialize the rows of a queryset without instantiating models.
+
+    :param queryset: The queryset to serialize.
+    :type queryset: django.db.models.QuerySet
+    :return: The serialized rows.
+    :rtype: list
+    """
+    return get_serializer(queryset.model).serialize_many(queryset)
+
+
+def compile_serializers():
+    """
+    Compile the serializers of every installed ``BaseModel`` subclass.
+
+    Called from ``FrameConfig.ready`` so the first save doesn't pay for it.
+    """
+    from frame.models import BaseModel
+
+    for model in apps.get_models():
+        if issubclass(model, BaseModel):
+            get_serializer(model)
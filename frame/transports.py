@@ -0,0 +1,846 @@
+"""
+Event transports used to publish and consume FRAME events.
+
+``SNSSQSTransport`` fans events out through SNS topics to one SQS queue per
+channel.  ``InProcessTransport`` and ``SQLiteTransport`` provide the same
+semantics without AWS, for tests and single-node deployments, including the
+message group ordering and content-based deduplication of FIFO channels.  The
+transport is chosen with the ``FRAME_EVENT_TRANSPORT`` setting.
+"""
+
+import collections
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from frame import aws_utils
+
+# SNS and SQS FIFO deduplication interval in seconds
+DEDUPLICATION_INTERVAL = 300
+
+MESSAGE_ID_ATTRIBUTE = "frame_message_id"
+
+
+# SNS error codes meaning a cached topic ARN no longer points to a topic
+TOPIC_MISSING_ERRORS = {
+    "NotFound",
+    "NotFoundException",
+    "InvalidParameter",
+    "InvalidParameterException",
+}
+
+
+def _digest(message):
+    return hashlib.sha256(message.encode()).hexdigest()
+
+
+def _is_topic_missing(error):
+    # botocore's ClientError carries the error code in its response; other
+    # errors, such as throttling or connection errors, leave the ARN valid
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in TOPIC_MISSING_ERRORS
+
+
+def get_max_receive_count():
+    """
+    Get the number of receives after which a message is moved to its queue's
+    dead-letter queue, from ``FRAME_WORKER_MAX_RECEIVES``.
+
+    :rtype: int
+    """
+    return getattr(settings, "FRAME_WORKER_MAX_RECEIVES", 10)
+
+
+class BaseTransport:
+    """
+    Interface implemented by event transports.
+
+    Every channel has one queue, created and subscribed to the channel by
+    ``provision_queue``.  Received messages are dictionaries with a
+    ``MessageId``, a ``ReceiptHandle`` used to acknowledge them, the
+    published message as ``Body``, its ``GroupId`` and its ``ReceiveCount``.
+
+    Every queue has a dead-letter queue.  Messages received more than
+    ``FRAME_WORKER_MAX_RECEIVES`` times are moved there, and keep their
+    ``MessageId`` when they are replayed.
+
+    On FIFO channels, see ``aws_utils.is_fifo_channel``, messages of the same
+    group are delivered in order and a group is not delivered again while one
+    of its messages is in flight.  Identical messages published within five
+    minutes are delivered once.  ``GroupId`` is None on other channels.
+    """
+
+    def publish(self, channel, message, group_id=None):
+        """
+        Publish a message to a channel.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param message: The message to publish.
+        :type message: str
+        :param group_id: The message group on FIFO channels. Defaults to the
+            channel.
+        :type group_id: str or None
+        """
+        raise NotImplementedError
+
+    def publish_batch(self, channel, messages, group_ids=None):
+        """
+        Publish several messages to a channel.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param messages: The messages to publish.
+        :type messages: list
+        :param group_ids: The message group of each message on FIFO channels.
+        :type group_ids: list or None
+        :return: The indexes of the messages that could not be published.
+        :rtype: list
+        """
+        failed = []
+        for index, message in enumerate(messages):
+            try:
+                self.publish(
+                    channel, message, group_id=group_ids[index] if group_ids else None
+                )
+            except Exception as e:
+                print(f"Error publishing event to {channel}: {e}")
+                failed.append(index)
+        return failed
+
+    def provision_queue(self, channel):
+        """
+        Create the queue of a channel, with its dead-letter queue, and
+        subscribe it to the channel.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :return: The queue identifier passed to the other queue methods.
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def dead_letter_queue(self, channel):
+        """
+        Get the dead-letter queue of a channel's queue, creating it if needed.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :return: The queue identifier of the dead-letter queue.
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def send_batch(self, queue, messages):
+        """
+        Put received messages directly on a queue, bypassing the channel.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param messages: Received messages; their ``Body``, ``MessageId`` and
+            ``GroupId`` are kept.
+        :type messages: list
+        :return: The indexes of the messages that could not be sent.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def dead_letter(self, channel, message):
+        """
+        Move a received message to the dead-letter queue of a channel.  The
+        caller still deletes it from the channel's queue.
+
+        :param channel: The name of the channel.
+        :type channel: str
+        :param message: The received message.
+        :type message: dict
+        :return: True if the message was sent to the dead-letter queue.
+        :rtype: bool
+        """
+        return not self.send_batch(self.dead_letter_queue(channel), [message])
+
+    def receive(self, queue, max_messages=10, wait_time=20):
+        """
+        Receive messages from a queue, waiting up to ``wait_time`` seconds.
+
+        Received messages are hidden from other consumers until they are
+        deleted or their visibility timeout expires.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param max_messages: The maximum number of messages to receive.
+        :type max_messages: int
+        :param wait_time: Seconds to wait for a message.
+        :type wait_time: float
+        :return: The received messages.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def delete_batch(self, queue, receipt_handles):
+        """
+        Delete received messages from a queue.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param receipt_handles: Up to ten receipt handles.
+        :type receipt_handles: list
+        :return: The receipt handles that could not be deleted.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def change_visibility(self, queue, receipt_handles, timeout):
+        """
+        Hide received messages from other consumers for another ``timeout``
+        seconds, counted from now.  A timeout of 0 makes them visible again.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param receipt_handles: Up to ten receipt handles.
+        :type receipt_handles: list
+        :param timeout: The new visibility timeout in seconds.
+        :type timeout: int
+        :return: The receipt handles whose visibility could not be changed.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+
+class SNSSQSTransport(BaseTransport):
+    """
+    Publish events to SNS topics and consume them from SQS queues.
+    """
+
+    def publish(self, channel, message, group_id=None):
+        topic_arn = aws_utils.get_or_create_topic(channel)
+        if not topic_arn:
+            raise RuntimeError(f"No SNS topic for {channel}")
+        kwargs = {}
+        if aws_utils.is_fifo_channel(channel):
+            kwargs["MessageGroupId"] = group_id or channel
+        try:
+            aws_utils.get_client("sns").publish(
+                TopicArn=topic_arn, Message=message, **kwargs
+            )
+        except Exception as e:
+            if _is_topic_missing(e):
+                aws_utils.topic_arns.invalidate(channel)
+            raise
+
+    def publish_batch(self, channel, messages, group_ids=None):
+        topic_arn = aws_utils.get_or_create_topic(channel)
+        if not topic_arn:
+            return list(range(len(messages)))
+
+        fifo = aws_utils.is_fifo_channel(channel)
+        failed = []
+        for start in range(0, len(messages), 10):
+            chunk = messages[start : start + 10]
+            entries = [
+                {"Id": str(start + i), "Message": message}
+                for i, message in enumerate(chunk)
+            ]
+            if fifo:
+                for entry in entries:
+                    index = int(entry["Id"])
+                    entry["MessageGroupId"] = (
+                        group_ids[index] if group_ids else None
+                    ) or channel
+            try:
+                response = aws_utils.get_client("sns").publish_batch(
+                    TopicArn=topic_arn, PublishBatchRequestEntries=entries
+                )
+                failed.extend(int(entry["Id"]) for entry in response.get("Failed", []))
+            except Exception as e:
+                if _is_topic_missing(e):
+                    aws_utils.topic_arns.invalidate(channel)
+                print(f"Error publishing events to {channel}: {e}")
+                failed.extend(range(start, start + len(chunk)))
+        return failed
+
+    def provision_queue(self, channel):
+        queue_url = aws_utils.get_or_create_queue(aws_utils.get_queue_name(channel))
+        queue_arn = aws_utils.get_queue_arn(queue_url)
+        dead_letter_arn = aws_utils.get_queue_arn(self.dead_letter_queue(channel))
+        attributes = {
+            "RedrivePolicy": json.dumps(
+                {
+                    "deadLetterTargetArn": dead_letter_arn,
+                    "maxReceiveCount": str(get_max_receive_count()),
+                }
+            )
+        }
+
+        topic_arn = aws_utils.get_or_create_topic(channel)
+        if topic_arn:
+            attributes["Policy"] = json.dumps(
+                {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Principal": "*",
+                            "Action": "sqs:SendMessage",
+                            "Resource": queue_arn,
+                        }
+                    ],
+                }
+            )
+        aws_utils.get_client("sqs").set_queue_attributes(
+            QueueUrl=queue_url, Attributes=attributes
+        )
+
+        if topic_arn:
+            aws_utils.get_client("sns").subscribe(
+                TopicArn=topic_arn, Protocol="sqs", Endpoint=queue_arn
+            )
+
+        return queue_url
+
+    def dead_letter_queue(self, channel):
+        return aws_utils.get_or_create_queue(
+            aws_utils.get_dead_letter_queue_name(channel)
+        )
+
+    def send_batch(self, queue, messages):
+        fifo = queue.endswith(".fifo")
+        failed = []
+        for start in range(0, len(messages), 10):
+            entries = []
+            for i, message in enumerate(messages[start : start + 10]):
+                entry = {"Id": str(start + i), "MessageBody": message["Body"]}
+                if message.get("MessageId"):
+                    entry["MessageAttributes"] = {
+                        MESSAGE_ID_ATTRIBUTE: {
+                            "DataType": "String",
+                            "StringValue": message["MessageId"],
+                        }
+                    }
+                if fifo:
+                    entry["MessageGroupId"] = message.get("GroupId") or "default"
+                entries.append(entry)
+            try:
+                response = aws_utils.get_client("sqs").send_message_batch(
+                    QueueUrl=queue, Entries=entries
+                )
+                failed.extend(int(entry["Id"]) for entry in response.get("Failed", []))
+            except Exception as e:
+                print(f"Error sending messages to {queue}: {e}")
+                failed.extend(int(entry["Id"]) for entry in entries)
+        return failed
+
+    def receive(self, queue, max_messages=10, wait_time=20):
+        response = aws_utils.get_client("sqs").receive_message(
+            QueueUrl=queue,
+            MaxNumberOfMessages=max_messages,
+            WaitTimeSeconds=wait_time,
+            AttributeNames=["MessageGroupId", "ApproximateReceiveCount"],
+            MessageAttributeNames=[MESSAGE_ID_ATTRIBUTE],
+        )
+        return [self._unwrap(message) for message in response.get("Messages", [])]
+
+    def delete_batch(self, queue, receipt_handles):
+        response = aws_utils.get_client("sqs").delete_message_batch(
+            QueueUrl=queue,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": handle}
+                for i, handle in enumerate(receipt_handles)
+            ],
+        )
+        return [
+            receipt_handles[int(entry["Id"])] for entry in response.get("Failed", [])
+        ]
+
+    def change_visibility(self, queue, receipt_handles, timeout):
+        response = aws_utils.get_client("sqs").change_message_visibility_batch(
+            QueueUrl=queue,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": handle, "VisibilityTimeout": timeout}
+                for i, handle in enumerate(receipt_handles)
+            ],
+        )
+        return [
+            receipt_handles[int(entry["Id"])] for entry in response.get("Failed", [])
+        ]
+
+    def _unwrap(self, message):
+        # SNS wraps the published message in a JSON notification envelope
+        body = message["Body"]
+        message_id = message["MessageId"]
+        try:
+            envelope = json.loads(body)
+            body = envelope["Message"]
+            message_id = envelope.get("MessageId", message_id)
+        except (ValueError, KeyError, TypeError):
+            pass
+        # Replayed dead letters keep the ID they were first delivered with
+        original_id = message.get("MessageAttributes", {}).get(MESSAGE_ID_ATTRIBUTE)
+        if original_id:
+            message_id = original_id["StringValue"]
+        attributes = message.get("Attributes", {})
+        return {
+            "MessageId": message_id,
+            "ReceiptHandle": message["ReceiptHandle"],
+            "Body": body,
+            "GroupId": attributes.get("MessageGroupId"),
+            "ReceiveCount": int(attributes.get("ApproximateReceiveCount", 1)),
+        }
+
+
+class InProcessTransport(BaseTransport):
+    """
+    Deliver events between threads of the same process.
+
+    Intended for tests and for running the worker inside the web process.
+    Messages published before a channel's queue is provisioned are dropped,
+    as they are by SNS.
+    """
+
+    def __init__(self, visibility_timeout=30):
+        self.visibility_timeout = visibility_timeout
+        self._subscriptions = collections.defaultdict(set)
+        self._dead_letter_queues = {}
+        self._ready = collections.defaultdict(collections.deque)
+        self._in_flight = collections.defaultdict(dict)
+        self._deduplication = collections.defaultdict(dict)
+        self._condition = threading.Condition()
+        # Messages are ordered by when they were sent, also after a redelivery
+        self._sequence = itertools.count()
+
+    def publish(self, channel, message, group_id=None):
+        with self._condition:
+            if aws_utils.is_fifo_channel(channel):
+                if self._is_duplicate(channel, message):
+                    return
+                group_id = group_id or channel
+            else:
+                group_id = None
+            for queue in self._subscriptions[channel]:
+                self._ready[queue].append(
+                    (next(self._sequence), str(uuid.uuid4()), message, group_id, 0)
+                )
+            self._condition.notify_all()
+
+    def provision_queue(self, channel):
+        queue = aws_utils.get_queue_name(channel)
+        with self._condition:
+            self._subscriptions[channel].add(queue)
+            self._dead_letter_queues[queue] = self.dead_letter_queue(channel)
+        return queue
+
+    def dead_letter_queue(self, channel):
+        return aws_utils.get_dead_letter_queue_name(channel)
+
+    def send_batch(self, queue, messages):
+        with self._condition:
+            for message in messages:
+                self._ready[queue].append(
+                    (
+                        next(self._sequence),
+                        message.get("MessageId") or str(uuid.uuid4()),
+                        message["Body"],
+                        message.get("GroupId"),
+                        0,
+                    )
+                )
+            self._condition.notify_all()
+        return []
+
+    def receive(self, queue, max_messages=10, wait_time=20):
+        deadline = time.monotonic() + wait_time
+        with self._condition:
+            while True:
+                self._restore_expired(queue)
+                messages = self._take(queue, max_messages)
+                if messages:
+                    return messages
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(min(remaining, 1))
+
+    def delete_batch(self, queue, receipt_handles):
+        with self._condition:
+            in_flight = self._in_flight[queue]
+            failed = [
+                handle
+                for handle in receipt_handles
+                if in_flight.pop(handle, None) is None
+            ]
+            # Deleting a message can unblock its group
+            self._condition.notify_all()
+            return failed
+
+    def change_visibility(self, queue, receipt_handles, timeout):
+        with self._condition:
+            in_flight = self._in_flight[queue]
+            failed = []
+            for handle in receipt_handles:
+                entry = in_flight.get(handle)
+                if entry is None:
+                    failed.append(handle)
+                else:
+                    in_flight[handle] = entry[:5] + (time.monotonic() + timeout,)
+            self._condition.notify_all()
+            return failed
+
+    def _take(self, queue, max_messages):
+        in_flight = self._in_flight[queue]
+        blocked = {entry[3] for entry in in_flight.values() if entry[3] is not None}
+        dead_letter_queue = self._dead_letter_queues.get(queue)
+        max_receive_count = get_max_receive_count()
+        messages, skipped = [], []
+        visible_at = time.monotonic() + self.visibility_timeout
+        ready = self._ready[queue]
+        while ready and len(messages) < max_messages:
+            sequence, message_id, body, group_id, receive_count = entry = (
+                ready.popleft()
+            )
+            if group_id in blocked:
+                skipped.append(entry)
+                continue
+            if dead_letter_queue and receive_count >= max_receive_count:
+                # Redrive policy: move the message to the dead-letter queue
+                self._ready[dead_letter_queue].append(
+                    (next(self._sequence), message_id, body, group_id, 0)
+                )
+                continue
+            receive_count += 1
+            receipt_handle = str(uuid.uuid4())
+            in_flight[receipt_handle] = (
+                sequence,
+                message_id,
+                body,
+                group_id,
+                receive_count,
+                visible_at,
+            )
+            messages.append(
+                {
+                    "MessageId": message_id,
+                    "ReceiptHandle": receipt_handle,
+                    "Body": body,
+                    "GroupId": group_id,
+                    "ReceiveCount": receive_count,
+                }
+            )
+        ready.extendleft(reversed(skipped))
+        return messages
+
+    def _restore_expired(self, queue):
+        now = time.monotonic()
+        in_flight = self._in_flight[queue]
+        expired = []
+        for handle, entry in list(in_flight.items()):
+            if entry[5] <= now:
+                del in_flight[handle]
+                expired.append(entry[:5])
+        if expired:
+            # Put expired messages back in the order they were sent, so a
+            # message group is redelivered in order whenever its messages expire
+            self._ready[queue] = collections.deque(
+                heapq.merge(self._ready[queue], sorted(expired))
+            )
+
+    def _is_duplicate(self, channel, message):
+        now = time.monotonic()
+        seen = self._deduplication[channel]
+        for digest, expires_at in list(seen.items()):
+            if expires_at <= now:
+                del seen[digest]
+        digest = _digest(message)
+        if digest in seen:
+            return True
+        seen[digest] = now + DEDUPLICATION_INTERVAL
+        return False
+
+
+class SQLiteTransport(BaseTransport):
+    """
+    Durable event queues in a SQLite database, for single-node deployments.
+
+    Several processes on the same machine can publish and consume through the
+    same database file.
+    """
+
+    def __init__(self, path, visibility_timeout=30, poll_interval=0.05):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    channel TEXT NOT NULL,
+                    queue TEXT NOT NULL,
+                    PRIMARY KEY (channel, queue)
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    visible_at REAL NOT NULL,
+                    receipt_handle TEXT
+                );
+                CREATE INDEX IF NOT EXISTS messages_queue_visible
+                    ON messages (queue, visible_at);
+                CREATE TABLE IF NOT EXISTS deduplication (
+                    channel TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (channel, digest)
+                );
+                CREATE TABLE IF NOT EXISTS dead_letter_queues (
+                    queue TEXT PRIMARY KEY,
+                    dead_letter_queue TEXT NOT NULL
+                );
+                """)
+            columns = [
+                row[1] for row in connection.execute("PRAGMA table_info(messages)")
+            ]
+            # Columns added after the table was first created
+            for column, definition in (
+                ("group_id", "TEXT"),
+                ("receive_count", "INTEGER NOT NULL DEFAULT 0"),
+                ("message_id", "TEXT"),
+            ):
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE messages ADD COLUMN {column} {definition}"
+                    )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def publish(self, channel, message, group_id=None):
+        self.publish_batch(channel, [message], [group_id])
+
+    def publish_batch(self, channel, messages, group_ids=None):
+        group_ids = group_ids or [None] * len(messages)
+        with self._connect() as connection:
+            if aws_utils.is_fifo_channel(channel):
+                entries = self._deduplicate(connection, channel, messages, group_ids)
+            else:
+                entries = [(message, None) for message in messages]
+            queues = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT queue FROM subscriptions WHERE channel = ?", (channel,)
+                )
+            ]
+            connection.executemany(
+                "INSERT INTO messages (queue, body, group_id, visible_at) "
+                "VALUES (?, ?, ?, 0)",
+                [
+                    (queue, message, group_id)
+                    for queue in queues
+                    for message, group_id in entries
+                ],
+            )
+        return []
+
+    def _deduplicate(self, connection, channel, messages, group_ids):
+        now = time.time()
+        connection.execute("DELETE FROM deduplication WHERE expires_at <= ?", (now,))
+        entries = []
+        for message, group_id in zip(messages, group_ids):
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO deduplication (channel, digest, expires_at) "
+                "VALUES (?, ?, ?)",
+                (channel, _digest(message), now + DEDUPLICATION_INTERVAL),
+            ).rowcount
+            if inserted:
+                entries.append((message, group_id or channel))
+        return entries
+
+    def provision_queue(self, channel):
+        queue = aws_utils.get_queue_name(channel)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO subscriptions (channel, queue) VALUES (?, ?)",
+                (channel, queue),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO dead_letter_queues (queue, dead_letter_queue) "
+                "VALUES (?, ?)",
+                (queue, self.dead_letter_queue(channel)),
+            )
+        return queue
+
+    def dead_letter_queue(self, channel):
+        return aws_utils.get_dead_letter_queue_name(channel)
+
+    def send_batch(self, queue, messages):
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO messages (queue, body, group_id, message_id, visible_at) "
+                "VALUES (?, ?, ?, ?, 0)",
+                [
+                    (
+                        queue,
+                        message["Body"],
+                        message.get("GroupId"),
+                        message.get("MessageId"),
+                    )
+                    for message in messages
+                ],
+            )
+        return []
+
+    def receive(self, queue, max_messages=10, wait_time=20):
+        deadline = time.monotonic() + wait_time
+        while True:
+            messages = self._claim(queue, max_messages)
+            if messages or time.monotonic() >= deadline:
+                return messages
+            time.sleep(self.poll_interval)
+
+    def delete_batch(self, queue, receipt_handles):
+        failed = []
+        with self._connect() as connection:
+            for handle in receipt_handles:
+                deleted = connection.execute(
+                    "DELETE FROM messages WHERE queue = ? AND receipt_handle = ?",
+                    (queue, handle),
+                ).rowcount
+                if not deleted:
+                    failed.append(handle)
+        return failed
+
+    def change_visibility(self, queue, receipt_handles, timeout):
+        failed = []
+        visible_at = time.time() + timeout
+        with self._connect() as connection:
+            for handle in receipt_handles:
+                updated = connection.execute(
+                    "UPDATE messages SET visible_at = ? "
+                    "WHERE queue = ? AND receipt_handle = ?",
+                    (visible_at, queue, handle),
+                ).rowcount
+                if not updated:
+                    failed.append(handle)
+        return failed
+
+    def _claim(self, queue, max_messages):
+        connection = self._connect()
+        now = time.time()
+        max_receive_count = get_max_receive_count()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT dead_letter_queue FROM dead_letter_queues WHERE queue = ?",
+                (queue,),
+            ).fetchone()
+            dead_letter_queue = row[0] if row else None
+            # Skip groups that still have a message in flight
+            rows = connection.execute(
+                "SELECT id, body, group_id, receive_count, message_id FROM messages "
+                "WHERE queue = ? AND visible_at <= ? AND (group_id IS NULL "
+                "OR group_id NOT IN (SELECT group_id FROM messages WHERE queue = ? "
+                "AND visible_at > ? AND group_id IS NOT NULL)) "
+                "ORDER BY id LIMIT ?",
+                (queue, now, queue, now, max_messages),
+            ).fetchall()
+            messages = []
+            for row_id, body, group_id, receive_count, message_id in rows:
+                if dead_letter_queue and receive_count >= max_receive_count:
+                    # Redrive policy: move the message to the dead-letter queue
+                    connection.execute(
+                        "UPDATE messages SET queue = ?, receive_count = 0, "
+                        "visible_at = 0, receipt_handle = NULL, "
+                        "message_id = COALESCE(message_id, CAST(id AS TEXT)) "
+                        "WHERE id = ?",
+                        (dead_letter_queue, row_id),
+                    )
+                    continue
+                receipt_handle = str(uuid.uuid4())
+                connection.execute(
+                    "UPDATE messages SET visible_at = ?, receipt_handle = ?, "
+                    "receive_count = receive_count + 1 WHERE id = ?",
+                    (now + self.visibility_timeout, receipt_handle, row_id),
+                )
+                messages.append(
+                    {
+                        "MessageId": message_id or str(row_id),
+                        "ReceiptHandle": receipt_handle,
+                        "Body": body,
+                        "GroupId": group_id,
+                        "ReceiveCount": receive_count + 1,
+                    }
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return messages
+
+
+TRANSPORTS = {
+    "sns": SNSSQSTransport,
+    "inprocess": InProcessTransport,
+    "sqlite": SQLiteTransport,
+}
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _transport, _transport_lock
+    _transport = None
+    _transport_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_transport():
+    """
+    Get the process-wide event transport.
+
+    ``FRAME_EVENT_TRANSPORT`` is ``"sns"`` (the default), ``"inprocess"``,
+    ``"sqlite"`` or the dotted path of a ``BaseTransport`` subclass.  The
+    SQLite database is stored at ``FRAME_EVENT_TRANSPORT_PATH``.
+
+    :return: The event transport.
+    :rtype: BaseTransport
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                name = getattr(settings, "FRAME_EVENT_TRANSPORT", "sns")
+                if name in TRANSPORTS:
+                    transport_class = TRANSPORTS[name]
+                else:
+                    try:
+                        transport_class = import_string(name)
+                    except ImportError as e:
+                        raise ImproperlyConfigured(
+                            f"Unknown FRAME_EVENT_TRANSPORT {name!r}"
+                        ) from e
+                if transport_class is SQLiteTransport:
+                    _transport = SQLiteTransport(
+                        getattr(
+                            settings,
+                            "FRAME_EVENT_TRANSPORT_PATH",
+                            "frame_events.sqlite3",
+                        )
+                    )
+                else:
+                    _transport = transport_class()
+    return _transport
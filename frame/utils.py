@@ -1,11 +1,16 @@
 from django import forms
 from django.apps import apps
+from frame.registry import get_view_metadata
 
 
-def get_enabled_fields(app_name, model_name, user, view_type="list", properties=True):
+def get_enabled_fields(
+    app_name, model_name, user, view_type="list", properties=True, include_pk=True
+):
     """
     Get the enabled fields for a model based on the user's permissions and the view type.
 
+    The fields come from the compiled model registry and must not be modified.
+
     :param app_name: The name of the app.
     :type app_name: str
     :param model_name: The name of the model.
@@ -16,36 +21,18 @@ def get_enabled_fields(app_name, model_name, user, view_type="list", properties=
     :type view_type: str
     :param properties: Whether to include properties in the enabled fields.
     :type properties: bool
-    :return: A list of enabled field names.
-    :rtype: list
+    :param include_pk: Whether to include a configured ``pk`` property.
+    :type include_pk: bool
+    :return: The enabled field names.
+    :rtype: tuple
     """
     model = apps.get_model(app_label=app_name, model_name=model_name)
-    model_config = model.get_config()
-    field_configs = model_config["fields"]
-    model_field_names = [field.name for field in model._meta.get_fields()]
-    enabled_fields = []
-    for field_config in field_configs:
-        if field_config["name"] in model_field_names:
-            field = model._meta.get_field(field_config["name"])
-            if not (field.auto_created or field.one_to_one or field.many_to_many):
-                if view_type == "list" and field_config["enable_in_list"]:
-                    enabled_fields.append(field_config["name"])
-                elif view_type == "detail" and field_config["enable_in_detail"]:
-                    enabled_fields.append(field_config["name"])
-                elif view_type == "form" and field_config["enable_in_form"]:
-                    enabled_fields.append(field_config["name"])
-    if view_type != "form" and "props" in model_config:
-        properties = [
-            prop for prop in dir(model) if isinstance(getattr(model, prop), property)
-        ]
-        model_prop_names = [prop["name"] for prop in model_config["props"]]
-        for prop in properties:
-            if prop in model_prop_names:
-                enabled_fields.append(prop)
-
-    if "is_deleted" in enabled_fields:
-        enabled_fields.pop(enabled_fields.index("is_deleted"))
-    return enabled_fields
+    metadata = get_view_metadata(model, view_type)
+    if not properties:
+        return metadata.fields
+    if not include_pk:
+        return metadata.display_fields
+    return metadata.enabled_fields
 
 
 def get_editable_fields(app_name, model_name, user, view_type="list"):
@@ -53,26 +40,12 @@ def get_editable_fields(app_name, model_name, user, view_type="list"):
     Get the fields that are editable in the list view
     In the model configuration, the fields that are editable in the list view
     have the property 'editable_in_list' set to True
-    """
 
+    :return: A read-only mapping of the editable field names to their field type.
+    :rtype: mappingproxy
+    """
     model = apps.get_model(app_label=app_name, model_name=model_name)
-    model_config = model.get_config()
-    field_configs = model_config["fields"]
-    model_field_names = [field.name for field in model._meta.get_fields()]
-    enabled_fields = {}
-    for field_config in field_configs:
-        if field_config["name"] in model_field_names:
-            field = model._meta.get_field(field_config["name"])
-            if not (field.auto_created or field.one_to_one or field.many_to_many):
-                if "editable_in_list" in field_config:
-                    if view_type == "list" and field_config["editable_in_list"]:
-                        # Return the field name and the field type
-                        enabled_fields[field_config["name"]] = field.get_internal_type()
-                        if field.get_internal_type() == "CharField":
-                            # Check for choices
-                            if field.choices:
-                                enabled_fields[field_config["name"]] = "ChoiceField"
-    return enabled_fields
+    return get_view_metadata(model, view_type).editable_fields
 
 
 def get_field_choices(app_name, model_name, field_name):
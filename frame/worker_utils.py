@@ -0,0 +1,605 @@
+import collections
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from django import db
+from django.utils import timezone
+
+
+class AckBatcher:
+    """
+    Acknowledge received messages in batches of up to ten.
+
+    Receipt handles are collected until ``max_size`` of them are pending or the
+    oldest has waited ``max_delay`` seconds.  Entries that fail are retried on
+    their own, up to ``max_retries`` times.
+    """
+
+    def __init__(self, transport, queue, max_size=10, max_delay=1.0, max_retries=3):
+        self.transport = transport
+        self.queue = queue
+        self.max_size = min(max_size, 10)
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, receipt_handle):
+        """
+        Queue a message for deletion, flushing if the batch is full or due.
+
+        :param receipt_handle: The receipt handle of the message.
+        :type receipt_handle: str
+        """
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(receipt_handle)
+            if len(self._pending) < self.max_size and not self._is_due():
+                return
+            batch = self._take()
+        self._delete(batch)
+
+    def flush_if_due(self):
+        """
+        Flush pending acknowledgements if the oldest has waited ``max_delay``.
+        """
+        with self._lock:
+            if not self._pending or not self._is_due():
+                return
+            batch = self._take()
+        self._delete(batch)
+
+    def flush(self):
+        """
+        Flush all pending acknowledgements.
+        """
+        with self._lock:
+            batch = self._take()
+        self._delete(batch)
+
+    def _is_due(self):
+        return time.monotonic() - self._oldest >= self.max_delay
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _delete(self, receipt_handles):
+        for start in range(0, len(receipt_handles), self.max_size):
+            pending = receipt_handles[start : start + self.max_size]
+            for _ in range(self.max_retries + 1):
+                try:
+                    pending = self.transport.delete_batch(self.queue, pending)
+                except Exception as e:
+                    print(f"Error deleting messages from {self.queue}: {e}")
+                if not pending:
+                    break
+            if pending:
+                print(
+                    f"Could not delete {len(pending)} messages from {self.queue}; "
+                    "they will be redelivered"
+                )
+
+
+class VisibilityHeartbeat:
+    """
+    Keep received messages hidden from other consumers while they are being
+    processed.
+
+    Every ``interval`` seconds, the visibility timeout of each tracked message
+    that was received at least ``interval`` seconds ago is extended to
+    ``visibility_timeout`` seconds from now.  Quick messages are acknowledged
+    before they need a heartbeat.
+    """
+
+    def __init__(self, transport, visibility_timeout=30, interval=None):
+        self.transport = transport
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval or visibility_timeout / 3
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def track(self, queue, receipt_handles):
+        """
+        Start extending the visibility of received messages.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param receipt_handles: The receipt handles of the messages.
+        :type receipt_handles: list
+        """
+        now = time.monotonic()
+        with self._lock:
+            tracked = self._tracked.setdefault(queue, {})
+            for handle in receipt_handles:
+                tracked[handle] = now
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="frame-heartbeat", daemon=True
+                )
+                self._thread.start()
+
+    def untrack(self, queue, receipt_handles):
+        """
+        Stop extending the visibility of messages.
+
+        :param queue: The queue identifier.
+        :type queue: str
+        :param receipt_handles: The receipt handles of the messages.
+        :type receipt_handles: list
+        """
+        with self._lock:
+            tracked = self._tracked.get(queue, {})
+            for handle in receipt_handles:
+                tracked.pop(handle, None)
+
+    def stop(self):
+        """
+        Stop the heartbeat thread.
+        """
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            received_before = time.monotonic() - self.interval
+            with self._lock:
+                due = {
+                    queue: [
+                        handle
+                        for handle, received_at in tracked.items()
+                        if received_at <= received_before
+                    ]
+                    for queue, tracked in self._tracked.items()
+                }
+            for queue, handles in due.items():
+                for start in range(0, len(handles), 10):
+                    try:
+                        self.transport.change_visibility(
+                            queue, handles[start : start + 10], self.visibility_timeout
+                        )
+                    except Exception as e:
+                        print(f"Error extending message visibility on {queue}: {e}")
+
+
+class Prefetcher:
+    """
+    Receive messages from a queue ahead of processing, on a background thread.
+
+    Messages are only received while fewer than ``high_water`` messages are
+    buffered or being processed, so the worker never holds more than it can
+    work through.  Call ``release`` once taken messages have been processed.
+    """
+
+    def __init__(self, receive, high_water, wait_time=20):
+        self.receive = receive
+        self.high_water = high_water
+        self.wait_time = wait_time
+        self._buffer = collections.deque()
+        self._outstanding = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """
+        Start the receiving thread.
+        """
+        self._thread = threading.Thread(
+            target=self._run, name="frame-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def take(self, max_messages=10, timeout=20):
+        """
+        Take buffered messages, waiting up to ``timeout`` seconds for some.
+
+        :param max_messages: The maximum number of messages to take.
+        :type max_messages: int
+        :param timeout: Seconds to wait for a message.
+        :type timeout: float
+        :return: The messages.
+        :rtype: list
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not self._buffer and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            messages = []
+            while self._buffer and len(messages) < max_messages:
+                messages.append(self._buffer.popleft())
+            return messages
+
+    def release(self, count):
+        """
+        Report that taken messages have been processed.
+
+        :param count: The number of messages.
+        :type count: int
+        """
+        with self._condition:
+            self._outstanding -= count
+            self._condition.notify_all()
+
+    def stop(self):
+        """
+        Stop receiving.
+
+        :return: The messages that were received but never taken.
+        :rtype: list
+        """
+        with self._condition:
+            self._stopped = True
+            messages = list(self._buffer)
+            self._buffer.clear()
+            self._condition.notify_all()
+            return messages
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and self._outstanding >= self.high_water:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                room = min(10, self.high_water - self._outstanding)
+            try:
+                messages = self.receive(room, self.wait_time)
+            except Exception as e:
+                print(f"Error receiving messages: {e}")
+                with self._condition:
+                    self._condition.wait(5)
+                continue
+            with self._condition:
+                self._outstanding += len(messages)
+                self._buffer.extend(messages)
+                self._condition.notify_all()
+
+
+def _setup_listener_process():
+    import django
+
+    django.setup()
+
+
+def _run_listener(func, *args):
+    # Pool threads live for the whole run, so recycle their connections
+    db.close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        db.close_old_connections()
+
+
+class ListenerDispatcher:
+    """
+    Run listeners on a shared thread pool, or a process pool for listeners
+    registered with ``executor="process"``.
+
+    A listener's ``max_concurrency`` is enforced when it is submitted, so a
+    saturated listener holds back the poll loop that feeds it rather than
+    tying up pool threads.
+
+    Events for batch listeners are collected until ``batch_size`` of them are
+    pending, the oldest has waited ``max_wait`` seconds or ``flush_batches``
+    is called for the listener, then passed to the listener in one call.
+    """
+
+    def __init__(self, threads=10, processes=None):
+        self.threads = threads
+        self.processes = processes
+        self._thread_pool = ThreadPoolExecutor(
+            threads, thread_name_prefix="frame-listener"
+        )
+        self._process_pool = None
+        self._semaphores = {}
+        self._batches = {}
+        self._batch_flusher = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def submit(self, listener, *args):
+        """
+        Schedule a listener call.
+
+        :param listener: The listener to call.
+        :type listener: Listener
+        :return: A future for the call's result. For batch listeners it
+            completes when the batch holding this event has been processed.
+        :rtype: concurrent.futures.Future
+        """
+        if listener.batch_size:
+            return self._add_to_batch(listener, args)
+        return self._call(listener, *args)
+
+    def _call(self, listener, *args):
+        semaphore = self._get_semaphore(listener)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            if listener.executor == "process":
+                future = self._get_process_pool().submit(
+                    _run_listener, listener.func, *args
+                )
+            else:
+                future = self._thread_pool.submit(_run_listener, listener.func, *args)
+        except Exception:
+            if semaphore:
+                semaphore.release()
+            raise
+        if semaphore:
+            future.add_done_callback(lambda _: semaphore.release())
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting listener calls and release the pools.
+
+        :param wait: Wait for running calls to finish.
+        :type wait: bool
+        """
+        self._stopped.set()
+        self.flush_batches(force=True)
+        self._thread_pool.shutdown(wait=wait)
+        if self._process_pool:
+            self._process_pool.shutdown(wait=wait)
+
+    def flush_batches(self, force=False, listeners=None):
+        """
+        Run every pending batch whose oldest event has waited ``max_wait``.
+
+        :param force: Run every pending batch, however long it has waited.
+        :type force: bool
+        :param listeners: Also run the pending batches of these listeners,
+            however long they have waited.
+        :type listeners: set or None
+        """
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for listener, (started, batch) in list(self._batches.items()):
+                if (
+                    force
+                    or (listeners and listener in listeners)
+                    or now - started >= listener.max_wait
+                ):
+                    del self._batches[listener]
+                    ready.append((listener, batch))
+        for listener, batch in ready:
+            self._run_batch(listener, batch)
+
+    def _add_to_batch(self, listener, event):
+        future = Future()
+        with self._lock:
+            if listener not in self._batches:
+                self._batches[listener] = (time.monotonic(), [])
+            batch = self._batches[listener][1]
+            batch.append((event, future))
+            full = len(batch) >= listener.batch_size
+            if full:
+                del self._batches[listener]
+            if self._batch_flusher is None:
+                self._batch_flusher = threading.Thread(
+                    target=self._flush_batches_periodically,
+                    name="frame-batch-flusher",
+                    daemon=True,
+                )
+                self._batch_flusher.start()
+        if full:
+            self._run_batch(listener, batch)
+        return future
+
+    def _run_batch(self, listener, batch):
+        def resolve(call):
+            error = call.exception()
+            for _, future in batch:
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+        try:
+            call = self._call(listener, [event for event, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        call.add_done_callback(resolve)
+
+    def _flush_batches_periodically(self):
+        while not self._stopped.wait(0.1):
+            self.flush_batches()
+
+    def _get_semaphore(self, listener):
+        if not listener.max_concurrency:
+            return None
+        with self._lock:
+            if listener not in self._semaphores:
+                self._semaphores[listener] = threading.BoundedSemaphore(
+                    listener.max_concurrency
+                )
+            return self._semaphores[listener]
+
+    def _get_process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_setup_listener_process,
+                )
+            return self._process_pool
+
+
+class WorkerSupervisor:
+    """
+    Fork one worker process per assignment and keep them running.
+
+    Children that exit are restarted with the same assignment after
+    ``restart_delay`` seconds, except those with an empty assignment that
+    exit cleanly, since they have nothing to do.  SIGTERM and SIGINT are forwarded to the
+    children as SIGTERM, and the supervisor returns once they have drained.
+    """
+
+    def __init__(self, target, assignments, restart_delay=1.0):
+        self.target = target
+        self.assignments = assignments
+        self.restart_delay = restart_delay
+        self.children = {}
+        self.stopping = False
+
+    def run(self):
+        """
+        Start the children and supervise them until they have all stopped.
+        """
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(len(self.assignments)):
+            self._spawn(slot)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            slot = self.children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code == 0 and not self.assignments[slot]:
+                continue
+            print(
+                f"SQSWorker: Process {pid} exited with status {exit_code}, restarting"
+            )
+            time.sleep(self.restart_delay)
+            if not self.stopping:
+                self._spawn(slot)
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            exit_code = 0
+            try:
+                self.target(self.assignments[slot])
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        print(f"SQSWorker: Started process {pid} for {self.assignments[slot]}")
+        self.children[pid] = slot
+
+    def _stop(self, signum, frame):
+        if self.stopping:
+            return
+        print("SQSWorker: Stopping worker processes")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+class MessageDeduplicator:
+    """
+    Remember which listeners have finished processing a message, so they are
+    not run again when the message is redelivered.
+
+    Completions are kept in an in-memory LRU of ``max_size`` messages and,
+    with ``use_database``, in the ``ProcessedMessage`` table shared by every
+    worker process.  Entries expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_size=10000, ttl=86400, use_database=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_database = use_database
+        self._completed = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def get_completed(self, message_ids):
+        """
+        Get the listeners that have already processed each message.
+
+        :param message_ids: The IDs of the received messages.
+        :type message_ids: list
+        :return: The names of the completed listeners, by message ID.
+        :rtype: dict
+        """
+        completed = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for message_id in message_ids:
+                entry = self._completed.get(message_id)
+                if entry and entry[1] > now:
+                    self._completed.move_to_end(message_id)
+                    completed[message_id] = entry[0]
+                else:
+                    missing.append(message_id)
+        if missing and self.use_database:
+            from frame.models import ProcessedMessage
+
+            rows = ProcessedMessage.objects.filter(
+                message_id__in=missing,
+                processed_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+            ).values_list("message_id", "listener")
+            for message_id, listener in rows:
+                completed.setdefault(message_id, set()).add(listener)
+        return completed
+
+    def mark_completed(self, message_id, listeners):
+        """
+        Record that listeners have processed a message.
+
+        :param message_id: The ID of the message.
+        :type message_id: str
+        :param listeners: The names of the listeners.
+        :type listeners: list
+        """
+        if not listeners:
+            return
+        with self._lock:
+            entry = self._completed.pop(message_id, None)
+            names = entry[0] if entry else set()
+            names.update(listeners)
+            self._completed[message_id] = (names, time.monotonic() + self.ttl)
+            while len(self._completed) > self.max_size:
+                self._completed.popitem(last=False)
+        if self.use_database:
+            from frame.models import ProcessedMessage
+
+            ProcessedMessage.objects.bulk_create(
+                [
+                    ProcessedMessage(message_id=message_id, listener=listener)
+                    for listener in listeners
+                ],
+                ignore_conflicts=True,
+            )
+            self._purge_if_due()
+
+    def _purge_if_due(self):
+        from frame.models import ProcessedMessage
+
+        now = time.monotonic()
+        if now - self._last_purge < min(self.ttl, 300):
+            return
+        self._last_purge = now
+        ProcessedMessage.objects.filter(
+            processed_at__lt=timezone.now() - timedelta(seconds=self.ttl)
+        ).delete()
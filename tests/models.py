@@ -0,0 +1,57 @@
+from django.db import models
+from frame.models import BaseModel
+
+
+class Part(BaseModel):
+    """
+    A model with one field of each type the serializers convert.
+    """
+
+    name = models.CharField(max_length=255)
+    code = models.UUIDField(null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField(default=0)
+    due = models.DateField(null=True)
+    shipped_at = models.DateTimeField(null=True)
+    details = models.JSONField(default=dict)
+
+
+WIDE_FIELDS = 40
+WIDE_PROPERTIES = 10
+
+
+def _wide_property(index):
+    return property(lambda self: getattr(self, f"field_{index}").upper())
+
+
+def _get_wide_config(cls):
+    return {
+        "fields": [
+            {
+                "name": f"field_{index}",
+                "enable_in_list": True,
+                "enable_in_detail": True,
+                "enable_in_form": True,
+            }
+            for index in range(WIDE_FIELDS)
+        ],
+        "props": [{"name": f"label_{index}"} for index in range(WIDE_PROPERTIES)],
+    }
+
+
+# A wide model with configured properties, built in a loop rather than
+# spelling out fifty attributes
+WidePart = type(
+    "WidePart",
+    (BaseModel,),
+    {
+        "__module__": __name__,
+        "__doc__": "A model with many fields and properties in its configuration.",
+        "get_config": classmethod(_get_wide_config),
+        **{
+            f"field_{index}": models.CharField(max_length=50, blank=True)
+            for index in range(WIDE_FIELDS)
+        },
+        **{f"label_{index}": _wide_property(index) for index in range(WIDE_PROPERTIES)},
+    },
+)
@@ -0,0 +1,23 @@
+"""
+Minimal settings for running FRAME's tests.
+
+Run the suite from the repository root with
+``python -m django test --settings=tests.settings`` or with ``pytest``.
+"""
+
+SECRET_KEY = "frame-tests"
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "frame",
+    "tests",
+]
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
+USE_TZ = True
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+FRAME_EVENT_TRANSPORT = "inprocess"
@@ -0,0 +1,106 @@
+"""
+Cold-start cost of importing FRAME.
+
+``-X importtime`` reports the modules imported by a fresh interpreter.  The
+benchmark checks that ``django.setup()`` with FRAME installed doesn't load the
+AWS SDK or WeasyPrint, which are only imported on first use, and prints how
+much installing FRAME adds to the import time of ``django.setup()``.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from django.test import SimpleTestCase
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+BASE_APPS = ["django.contrib.contenttypes", "django.contrib.auth"]
+
+# Modules that must not be imported until they are used
+LAZY_MODULES = ("boto3", "botocore", "weasyprint")
+
+# Generous, so only a regression such as a heavy module-level import fails
+FRAME_IMPORT_BUDGET_US = 250_000
+
+SETUP_CODE = """
+import django
+from django.conf import settings
+settings.configure(INSTALLED_APPS={apps!r}, USE_TZ=True)
+django.setup()
+{extra}
+"""
+
+
+def measure_imports(installed_apps, extra=""):
+    """
+    Set up Django in a fresh interpreter with ``-X importtime``.
+
+    Django imports apps and their models with ``importlib.import_module``,
+    which ``-X importtime`` doesn't report, but the modules those import
+    with ``import`` statements are.
+
+    :param installed_apps: The ``INSTALLED_APPS`` setting.
+    :type installed_apps: list
+    :param extra: Code run after ``django.setup()``.
+    :type extra: str
+    :return: ``(depth, name, cumulative_us)`` for every reported module.
+    :rtype: list
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            SETUP_CODE.format(apps=installed_apps, extra=extra),
+        ],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative)))
+    return imports
+
+
+def get_import_time(imports):
+    """
+    Get the total import time of a ``measure_imports`` run.
+
+    :param imports: The result of ``measure_imports``.
+    :type imports: list
+    :return: The import time in microseconds.
+    :rtype: int
+    """
+    return sum(cumulative for depth, _, cumulative in imports if depth == 0)
+
+
+class ImportTimeBenchmark(SimpleTestCase):
+    def test_setup_does_not_import_heavy_dependencies(self):
+        imports = measure_imports(
+            BASE_APPS + ["frame"], extra="import frame.models, frame.mixins"
+        )
+        loaded = [name for _, name, _ in imports if name.split(".")[0] in LAZY_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_frame_import_time(self):
+        # Best of three, to keep out noise from a busy machine
+        baseline_us = min(get_import_time(measure_imports(BASE_APPS)) for _ in range(3))
+        frame_us = min(
+            get_import_time(measure_imports(BASE_APPS + ["frame"])) for _ in range(3)
+        )
+        print(
+            f"\ndjango.setup(): {baseline_us / 1000:.1f} ms, "
+            f"{frame_us / 1000:.1f} ms with frame installed"
+        )
+        self.assertLess(frame_us - baseline_us, FRAME_IMPORT_BUDGET_US)
@@ -0,0 +1,80 @@
+"""
+Benchmark of the field lookup the list, detail and search views run on every
+request.
+
+``get_enabled_fields`` used to find a model's properties with ``dir`` and
+``getattr`` on every call.  It now reads them from the registry, which finds
+them once per model.
+"""
+
+import timeit
+from django.apps import apps
+from django.test import SimpleTestCase
+from frame.registry import get_model_properties
+from frame.utils import get_enabled_fields
+from tests.models import WidePart
+
+
+def get_enabled_fields_with_dir(model, view_type="list"):
+    model_config = model.get_config()
+    model_field_names = [field.name for field in model._meta.get_fields()]
+    enabled_fields = []
+    for field_config in model_config["fields"]:
+        if field_config["name"] in model_field_names:
+            field = model._meta.get_field(field_config["name"])
+            if not (field.auto_created or field.one_to_one or field.many_to_many):
+                if field_config[f"enable_in_{view_type}"]:
+                    enabled_fields.append(field_config["name"])
+    if view_type != "form" and "props" in model_config:
+        properties = [
+            prop for prop in dir(model) if isinstance(getattr(model, prop), property)
+        ]
+        model_prop_names = [prop["name"] for prop in model_config["props"]]
+        for prop in properties:
+            if prop in model_prop_names:
+                enabled_fields.append(prop)
+    if "is_deleted" in enabled_fields:
+        enabled_fields.remove("is_deleted")
+    return enabled_fields
+
+
+class PropertyDiscoveryBenchmark(SimpleTestCase):
+    def test_properties_match_dir_scan(self):
+        self.assertEqual(
+            list(get_model_properties(WidePart)),
+            [
+                name
+                for name in dir(WidePart)
+                if isinstance(getattr(WidePart, name), property)
+            ],
+        )
+
+    def test_enabled_fields_match_dir_scan(self):
+        for view_type in ("list", "detail", "form"):
+            self.assertEqual(
+                list(get_enabled_fields("tests", "widepart", None, view_type)),
+                get_enabled_fields_with_dir(WidePart, view_type),
+            )
+
+    def test_enabled_fields_speedup(self):
+        number = 1000
+        model = apps.get_model("tests", "widepart")
+        baseline = min(
+            timeit.repeat(
+                lambda: get_enabled_fields_with_dir(model), number=number, repeat=3
+            )
+        )
+        compiled = min(
+            timeit.repeat(
+                lambda: get_enabled_fields("tests", "widepart", None),
+                number=number,
+                repeat=3,
+            )
+        )
+        print(
+            f"\nget_enabled_fields per request on a model with "
+            f"{len(model._meta.fields)} fields: {baseline / number * 1e6:.1f} us "
+            f"with dir(), {compiled / number * 1e6:.1f} us from the registry "
+            f"(x{baseline / compiled:.0f})"
+        )
+        self.assertLess(compiled, baseline)
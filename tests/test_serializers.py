@@ -0,0 +1,64 @@
+"""
+Benchmark of ``BaseModel.serialize``, which runs on every save and delete.
+
+The precompiled per-model serializer is compared with ``model_to_dict``
+followed by a conversion of every value, which ``serialize`` used before.
+"""
+
+import datetime
+import timeit
+import uuid
+from decimal import Decimal
+from django.forms.models import model_to_dict
+from django.test import SimpleTestCase
+from tests.models import Part
+
+
+def serialize_with_model_to_dict(instance):
+    def convert_to_serializable(value):
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        elif isinstance(value, datetime.date):
+            return value.isoformat()
+        elif isinstance(value, Decimal):
+            return float(value)
+        return value
+
+    data = model_to_dict(instance)
+    return {k: convert_to_serializable(v) for k, v in data.items()}
+
+
+class SerializerBenchmark(SimpleTestCase):
+    def setUp(self):
+        self.part = Part(
+            pk=1,
+            name="Bolt",
+            code=uuid.uuid4(),
+            price=Decimal("1.25"),
+            quantity=40,
+            due=datetime.date(2024, 1, 2),
+            shipped_at=datetime.datetime(2024, 1, 1, 12, 30, tzinfo=datetime.UTC),
+            details={"material": "steel"},
+        )
+
+    def test_serialize_matches_model_to_dict(self):
+        expected = serialize_with_model_to_dict(self.part)
+        expected["code"] = str(expected["code"])
+        self.assertEqual(self.part.serialize(), expected)
+
+    def test_serialize_speedup(self):
+        number = 20000
+        baseline = min(
+            timeit.repeat(
+                lambda: serialize_with_model_to_dict(self.part),
+                number=number,
+                repeat=3,
+            )
+        )
+        compiled = min(timeit.repeat(self.part.serialize, number=number, repeat=3))
+        print(
+            f"\nserialize per save: {baseline / number * 1e6:.2f} us with "
+            f"model_to_dict, {compiled / number * 1e6:.2f} us precompiled "
+            f"(x{baseline / compiled:.1f})"
+        )
+        self.assertLess(compiled, baseline)